@@ -1,17 +1,82 @@
 from stls_lib import stls
 
+ROOT_DATA_PATH = "src/utils/root_data.txt"
+
 def handle_invalid_input(input_name, expected_values, value):
     print(f"\nInvalid input found at {input_name}. Input must be one of {expected_values}. Found: {value}")
     exit()
 
+def get_process_options(data):
+    """
+    Optional tuning settings shared by the single and multi-source modes.
+    Keys missing from root_data.txt fall back to these defaults.
+    """
+    return {
+        "queue_policy": data.get("queue_policy", "drop"),
+        "queue_size": data.get("queue_size", 2),
+        "inference_mode": data.get("inference_mode", "full"),
+        "roi_margin": data.get("roi_margin", 32),
+        "model_input_size": data.get("model_input_size", 640),
+        "inference_scheduler": data.get("inference_scheduler", "fixed"),
+        "inference_stride": data.get("inference_stride", 3),
+        "motion_threshold": data.get("motion_threshold", 0.002),
+        "min_refresh_interval": data.get("min_refresh_interval", 1.0),
+        "use_tracker": str(data.get("use_tracker", "false")).lower() == "true",
+        "model_backend": data.get("model_backend", "pytorch"),
+        "model_quantize": data.get("model_quantize", "none"),
+        "metrics_port": data.get("metrics_port", 0),
+        "metrics_json_path": data.get("metrics_json_path", "none"),
+        "metrics_interval": data.get("metrics_interval", 10.0),
+        "relay_backend": data.get("relay_backend", "rpi"),
+        "relay_debounce": data.get("relay_debounce", 0.2),
+        "relay_min_dwell": data.get("relay_min_dwell", 1.0),
+        "config_reload": str(data.get("config_reload", "false")).lower() == "true",
+        "config_poll_interval": data.get("config_poll_interval", 1.0),
+        "root_data_path": ROOT_DATA_PATH,
+        "capture_mode": data.get("capture_mode", "main"),
+        "record_events": str(data.get("record_events", "false")).lower() == "true",
+        "record_dir": data.get("record_dir", "recordings"),
+        "record_pre_seconds": data.get("record_pre_seconds", 5.0),
+        "record_post_seconds": data.get("record_post_seconds", 5.0),
+        "record_fps": data.get("record_fps", 5.0),
+        "record_width": data.get("record_width", 480),
+        "record_max_mb": data.get("record_max_mb", 1024),
+        "record_anomaly_latency": data.get("record_anomaly_latency", 0.0),
+    }
+
+def get_pipeline_options(data):
+    """
+    Settings of one single-source pipeline apart from its camera, zones and
+    relays, used by the single-source mode and by every supervisor worker.
+    """
+    return dict(
+        weight_file_path = data["weight_file_path"],
+        class_list_file_path = data["class_list_file_path"],
+        detect_sensitivity = data["detect_sensitivity"],
+        frame_name = data["frame_name"],
+        time_interval = data["time_interval"],
+        frame_height = data["frame_height"],
+        frame_width = data["frame_width"],
+        wait_key = data["wait_key"],
+        ord_key = data["ord_key"],
+        inference_server = data.get("inference_server", "none"),
+        inference_timeout = data.get("inference_timeout", 0.2),
+        inference_max_in_flight = data.get("inference_max_in_flight", 4),
+        inference_jpeg_quality = data.get("inference_jpeg_quality", 80),
+        latency_target = data.get("latency_target", 0.0),
+        latency_input_sizes = data.get("latency_input_sizes", "640,480,320"),
+        latency_strides = data.get("latency_strides", "1,2,3"),
+        **get_process_options(data)
+    )
+
 def process_rp_device(data):
     """
     Process the Raspberry Pi device logic.
     """
-    from stls_lib.rp import rp_write_points, rp_process_video
-    
+    # Each mode imports only what it needs: picamera2 for writing points, the detection stack for processing.
     write_points_mode = data["write_points_mode"].lower()
     if write_points_mode == "true":
+        from stls_lib.rp import rp_write_points
         rp_write_points.main(
                 save_path = data["zones_file_path"],
                 frame_height = data["frame_height"],
@@ -21,18 +86,77 @@ def process_rp_device(data):
             )
         exit()  # Exit after completing write_points
 
-    elif write_points_mode == "false":
-        rp_process_video.main(
+    if write_points_mode == "false" and str(data.get("offline_mode", "false")).lower() == "true":
+        # Recorded footage from video_source, analysed by a process pool as fast as possible.
+        from stls_lib import offline
+        offline.run_offline_analysis(
+                video_source = data["video_source"],
                 weight_file_path = data["weight_file_path"],
                 class_list_file_path = data["class_list_file_path"],
                 zones_file_path = data["zones_file_path"],
                 detect_sensitivity = data["detect_sensitivity"],
+                time_interval = data["time_interval"],
+                frame_width = data["frame_width"],
+                frame_height = data["frame_height"],
+                workers = data.get("offline_workers", 0),
+                chunk_seconds = data.get("offline_chunk_seconds", 60.0),
+                bucket_seconds = data.get("offline_bucket_seconds", 1.0),
+                output_path = data.get("offline_output_path", "offline_counts.csv"),
+                frame_stride = data.get("offline_frame_stride", 1),
+                batch_size = data.get("offline_batch_size", 8),
+                inference_mode = data.get("inference_mode", "full"),
+                roi_margin = data.get("roi_margin", 32),
+                model_input_size = data.get("model_input_size", 640),
+                model_backend = data.get("model_backend", "pytorch"),
+                model_quantize = data.get("model_quantize", "none")
+            )
+        return
+
+    if write_points_mode == "false" and str(data.get("supervisor_mode", "false")).lower() == "true":
+        # One capture and one pipeline process per block of sources_file_path, restarted when they crash.
+        from stls_lib import supervisor
+        supervisor.run_supervisor(
+                sources_file_path = data["sources_file_path"],
+                pipeline_options = get_pipeline_options(data),
+                cpus = data.get("supervisor_cpus", "auto"),
+                ring_slots = data.get("supervisor_ring_slots", 4),
+                restart_delay = data.get("supervisor_restart_delay", 1.0),
+                max_restart_delay = data.get("supervisor_max_restart_delay", 30.0)
+            )
+        return
+
+    from stls_lib.rp import rp_process_video
+
+    if write_points_mode == "false" and str(data.get("multi_source_mode", "false")).lower() == "true":
+        # The remote inference client and the latency controller only run in the single-source pipeline.
+        ignored = []
+        if str(data.get("inference_server", "none")).lower() != "none":
+            ignored.append("inference_server")
+        if float(data.get("latency_target", 0.0) or 0.0) > 0:
+            ignored.append("latency_target")
+        if ignored:
+            print(f"\nWarning: {', '.join(ignored)} not supported in multi_source_mode and will be ignored.")
+        rp_process_video.main_multi_source(
+                weight_file_path = data["weight_file_path"],
+                class_list_file_path = data["class_list_file_path"],
+                sources_file_path = data["sources_file_path"],
+                detect_sensitivity = data["detect_sensitivity"],
                 frame_name = data["frame_name"],
                 time_interval = data["time_interval"],
                 frame_height = data["frame_height"],
                 frame_width = data["frame_width"],
                 wait_key = data["wait_key"],
-                ord_key = data["ord_key"]
+                ord_key = data["ord_key"],
+                **get_process_options(data)
+            )
+
+    elif write_points_mode == "false":
+        rp_process_video.main(
+                zones_file_path = data["zones_file_path"],
+                frame_source = data.get("frame_source", "picamera"),
+                video_source = data.get("video_source"),
+                zone_relays = data.get("zone_relays"),
+                **get_pipeline_options(data)
             )
     else:
         handle_invalid_input("data[\"write_points_mode\"]", ["true", "false"], write_points_mode)
@@ -42,7 +166,7 @@ def main():
     """
     Main entry point for the script.
     """
-    data = stls.extract_root_data(file_path="src/utils/root_data.txt")
+    data = stls.extract_root_data(file_path=ROOT_DATA_PATH)
     process_rp_device(data)
 
 if __name__ == "__main__":
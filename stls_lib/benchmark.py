@@ -0,0 +1,301 @@
+"""
+Offline replay benchmark.
+
+Replays a recorded video or synthetic frames with scripted vehicles through
+the real stls functions and the rp_process_video decision logic, with a fake
+GPIO so no Raspberry Pi is needed. Reports FPS, p50/p95/p99 latency per
+stage and the time from a vehicle entering zone 0 to the relay switching.
+
+    python -m stls_lib.benchmark --synthetic --frames 600 --detector stub
+    python -m stls_lib.benchmark --video src/inference/videos/video.mp4 --detector yolo
+"""
+import argparse
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from stls_lib import fake_gpio
+
+STAGES = ["capture", "resize", "predict", "zone_test", "queuing", "draw"]
+
+
+class _Boxes:
+    def __init__(self, data):
+        self.data = _Array(data)
+
+
+class _Array:
+    def __init__(self, array):
+        self._array = array
+
+    def numpy(self):
+        return self._array
+
+
+class _Result:
+    def __init__(self, data):
+        self.boxes = _Boxes(data)
+
+
+class StubDetector:
+    """
+    Stand-in for a YOLO model with the same `predict` interface. Moving blobs
+    found by background subtraction are reported as `class_id` detections,
+    which is enough to drive the zone and relay logic on synthetic frames.
+    """
+
+    def __init__(self, class_id=1, min_area=100, max_area_ratio=0.5):
+        self.class_id = class_id
+        self.min_area = min_area
+        self.max_area_ratio = max_area_ratio
+        self._subtractor = cv2.createBackgroundSubtractorMOG2(history=200, detectShadows=False)
+
+    def detect(self, frame):
+        mask = self._subtractor.apply(frame)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        max_area = self.max_area_ratio * frame.shape[0] * frame.shape[1]
+        boxes = []
+        for contour in contours:
+            x, y, w, h = cv2.boundingRect(contour)
+            if self.min_area <= w * h <= max_area:
+                boxes.append((x, y, x + w, y + h, 0.9, self.class_id))
+        return np.array(boxes, dtype=np.float32).reshape(-1, 6)
+
+    def predict(self, source, **kwargs):
+        return [_Result(self.detect(frame)) for frame in source]
+
+
+def percentiles(samples):
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0}
+    values = np.asarray(samples) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99), "mean": float(values.mean())}
+
+
+def default_zones(frame_width, frame_height):
+    """A single zone over the middle third of the frame, used when no zones file is usable."""
+    x1, x2 = frame_width // 3, 2 * frame_width // 3
+    return {0: [(x1, 0), (x2, 0), (x2, frame_height - 1), (x1, frame_height - 1)]}
+
+
+def load_benchmark_zones(zones_file_path, frame_width, frame_height):
+    """Zones of `zones_file_path` scaled to the frame size, or default_zones when the file is missing or empty."""
+    from stls_lib import stls
+
+    if zones_file_path and os.path.exists(zones_file_path):
+        data = stls.extract_data_from_file(zones_file_path)
+        if data["zones"] and data["frame_width"] and data["frame_height"]:
+            return stls.convert_coordinates(data["zones"], data["frame_width"], data["frame_height"], frame_width, frame_height)
+    return default_zones(frame_width, frame_height)
+
+
+def run_benchmark(args):
+    fake_gpio.reset()
+
+    from stls_lib import stls
+    from stls_lib.detector import Detector
+    from stls_lib.frame_source import SyntheticSource
+    from stls_lib.overlay import OverlayRenderer
+    from stls_lib.queuing import ZoneQueuing
+    from stls_lib.relay import GPIOBackend, RelayActuator
+    from stls_lib.rp import rp_process_video
+    from stls_lib.scheduler import create_scheduler
+    from stls_lib.tracker import ZONE_ENTRY_COLUMN, IoUTracker
+
+    frame_width, frame_height = args.frame_width, args.frame_height
+    class_list = stls.load_class_names(args.class_list)
+    zones = load_benchmark_zones(args.zones, frame_width, frame_height)
+    zone_mask = stls.rasterize_zones(zones, frame_width, frame_height)
+    number_of_zones = len(zones)
+    renderer = OverlayRenderer("benchmark", class_list)
+
+    if args.detector == "stub":
+        model = StubDetector(class_id=class_list.index("car") if "car" in class_list else 0)
+        predict_imgsz = None
+    else:
+        model = stls.load_model(args.weights, args.backend, args.input_size, args.quantize, warmup=True)
+        predict_imgsz = None if args.backend == "pytorch" else args.input_size
+
+    # Predictions go through the same Detector wrapper and predict_boxes as the live pipeline.
+    detector = Detector(model, stls.get_vehicle_class_ids(class_list))
+    roi = stls.get_zones_roi(zones, frame_width, frame_height, args.roi_margin) if args.inference_mode == "roi" else None
+    scheduler = create_scheduler(args.scheduler, zone_mask, args.stride, args.motion_threshold, args.min_refresh_interval)
+    tracker = IoUTracker() if args.tracker else None
+
+    # The actuator is stepped with the replay clock instead of its worker thread, so timing stays deterministic.
+    switched = []
+    relay = RelayActuator(GPIOBackend(fake_gpio), rp_process_video.ZONE_0_RELAY_PINS, args.relay_debounce, args.relay_min_dwell,
+                          on_switch=switched.append, start_worker=False)
+
+    synthetic = None
+    cap = None
+    if args.video:
+        cap = cv2.VideoCapture(args.video)
+        if not cap.isOpened():
+            raise TypeError(f"Cannot open video source '{args.video}'.")
+        fps = cap.get(cv2.CAP_PROP_FPS) or args.fps
+    else:
+        synthetic = SyntheticSource(frame_width, frame_height, fps=args.fps, num_objects=args.objects)
+        fps = args.fps
+
+    timings = {stage: [] for stage in STAGES}
+    frame_times = []
+    queuing = ZoneQueuing(number_of_zones, args.time_interval)
+    inferences = 0
+    relay_switches = 0
+    pending_entry = None
+    relay_latencies = []
+    gt_occupied = False
+
+    wall_start = time.perf_counter()
+    for index in range(args.frames):
+        # Frame timestamps follow the source frame rate; processing time is added on top.
+        frame_ts = index / fps
+        frame_start = time.perf_counter()
+
+        t = time.perf_counter()
+        if cap is not None:
+            ok, frame = cap.read()
+            if not ok:
+                break
+        else:
+            frame = synthetic.render(index)
+        timings["capture"].append(time.perf_counter() - t)
+
+        # Ground truth for zone 0: scripted objects on synthetic frames, first in-zone detection otherwise.
+        if synthetic is not None:
+            centers = [((x1 + x2) // 2, (y1 + y2) // 2) for x1, y1, x2, y2 in synthetic.objects(index)]
+            occupied = any(0 <= cx < frame_width and 0 <= cy < frame_height and zone_mask[cy, cx] & 1 for cx, cy in centers)
+            if occupied and not gt_occupied and pending_entry is None:
+                pending_entry = frame_ts
+            gt_occupied = occupied
+
+        infer = scheduler.should_infer(frame, frame_ts)
+        if not infer and tracker is None:
+            frame_times.append(time.perf_counter() - frame_start)
+            continue
+
+        t = time.perf_counter()
+        frame = cv2.resize(frame, (frame_width, frame_height))
+        timings["resize"].append(time.perf_counter() - t)
+
+        boxes = None
+        if infer:
+            t = time.perf_counter()
+            boxes = rp_process_video.predict_boxes(frame, detector, args.confidence, roi, None, args.input_size, predict_imgsz)
+            timings["predict"].append(time.perf_counter() - t)
+            inferences += 1
+
+        t = time.perf_counter()
+        entry_times = None
+        if tracker is not None:
+            boxes = tracker.update(boxes, frame_ts, zone_mask, number_of_zones) if infer else tracker.predict(frame_ts, zone_mask, number_of_zones)
+            entry_times = boxes[:, ZONE_ENTRY_COLUMN:]
+        first_vehicle, vehicle_count, detections = stls.find_zone_vehicles(boxes, class_list, zone_mask, number_of_zones, entry_times)
+        timings["zone_test"].append(time.perf_counter() - t)
+
+        if synthetic is None and vehicle_count[0] > 0 and pending_entry is None and relay.state == 'none':
+            pending_entry = frame_ts
+
+        t = time.perf_counter()
+        decision_ts = frame_ts + (t - frame_start)
+        _, elapsed, changed = queuing.update(first_vehicle, vehicle_count, decision_ts)
+        zones_status = queuing.status(class_list, elapsed)
+        if changed[0]:
+            relay.request(zones_status[0]["vehicle"], decision_ts)
+        relay.step(decision_ts)
+        if switched:
+            relay_switches += len(switched)
+            if switched[-1] != 'none' and pending_entry is not None:
+                relay_latencies.append(frame_ts + (time.perf_counter() - frame_start) - pending_entry)
+                pending_entry = None
+            switched.clear()
+        timings["queuing"].append(time.perf_counter() - t)
+
+        if not args.no_draw:
+            t = time.perf_counter()
+            renderer.draw(frame, zones, None, detections, zones_status, (time.perf_counter() - frame_start) * 1000, bool(vehicle_count[0] > 0))
+            timings["draw"].append(time.perf_counter() - t)
+
+        frame_times.append(time.perf_counter() - frame_start)
+
+    wall_time = time.perf_counter() - wall_start
+    if cap is not None:
+        cap.release()
+
+    return {
+        "frames": len(frame_times),
+        "inferences": inferences,
+        "wall_time_s": wall_time,
+        "fps": len(frame_times) / wall_time if wall_time > 0 else 0.0,
+        "frame": percentiles(frame_times),
+        "stages": {stage: dict(percentiles(samples), count=len(samples)) for stage, samples in timings.items()},
+        "relay_switches": relay_switches,
+        "gpio_transitions": len(fake_gpio.transitions),
+        "relay_latency": dict(percentiles(relay_latencies), count=len(relay_latencies)),
+    }
+
+
+def print_report(report):
+    print(f"\nframes: {report['frames']}  inferences: {report['inferences']}  "
+          f"wall: {report['wall_time_s']:.2f} s  fps: {report['fps']:.1f}")
+    print(f"{'stage':<12}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, stats in report["stages"].items():
+        print(f"{stage:<12}{stats['count']:>8}{stats['p50']:>10.2f}{stats['p95']:>10.2f}{stats['p99']:>10.2f}")
+    frame = report["frame"]
+    print(f"{'frame':<12}{report['frames']:>8}{frame['p50']:>10.2f}{frame['p95']:>10.2f}{frame['p99']:>10.2f}")
+    latency = report["relay_latency"]
+    print(f"\nrelay switches: {report['relay_switches']}  gpio transitions: {report['gpio_transitions']}")
+    print(f"zone entry -> relay switch: n={latency['count']}  p50={latency['p50']:.1f} ms  "
+          f"p95={latency['p95']:.1f} ms  p99={latency['p99']:.1f} ms")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded or synthetic frames through the detection pipeline.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--video", help="Recorded video to replay.")
+    source.add_argument("--synthetic", action="store_true", help="Use synthetic frames with scripted vehicles (default).")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--fps", type=float, default=30.0, help="Frame rate of the synthetic source, or of a video that does not report one.")
+    parser.add_argument("--objects", type=int, default=3, help="Number of scripted vehicles on synthetic frames.")
+    parser.add_argument("--frame-width", type=int, default=1280)
+    parser.add_argument("--frame-height", type=int, default=800)
+    parser.add_argument("--zones", default="src/utils/zones.txt")
+    parser.add_argument("--class-list", default="src/utils/class.names")
+    parser.add_argument("--detector", choices=["stub", "yolo"], default="stub")
+    parser.add_argument("--weights", default="src/YOLO11_training/train_result/weights/best.pt")
+    parser.add_argument("--backend", default="pytorch")
+    parser.add_argument("--quantize", default="none")
+    parser.add_argument("--input-size", type=int, default=640)
+    parser.add_argument("--inference-mode", choices=["full", "roi"], default="full")
+    parser.add_argument("--roi-margin", type=int, default=32)
+    parser.add_argument("--confidence", type=float, default=0.15)
+    parser.add_argument("--scheduler", choices=["fixed", "motion"], default="fixed")
+    parser.add_argument("--stride", type=int, default=3)
+    parser.add_argument("--motion-threshold", type=float, default=0.002)
+    parser.add_argument("--min-refresh-interval", type=float, default=1.0)
+    parser.add_argument("--tracker", action="store_true")
+    parser.add_argument("--time-interval", type=float, default=3.0)
+    parser.add_argument("--relay-debounce", type=float, default=0.2)
+    parser.add_argument("--relay-min-dwell", type=float, default=1.0)
+    parser.add_argument("--no-draw", action="store_true", help="Skip the overlay drawing stage.")
+    parser.add_argument("--json", help="Also write the report to this JSON file.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run_benchmark(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
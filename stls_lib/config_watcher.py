@@ -0,0 +1,110 @@
+import os
+import threading
+
+
+def _file_stamp(path):
+    try:
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return None
+
+
+class ConfigWatcher:
+    """
+    Watch configuration files and reload them on a background thread.
+
+    Changes are picked up with inotify when the optional `inotify_simple`
+    package is installed and by polling mtimes every `interval` seconds
+    otherwise. The directories are watched rather than the files, because
+    most editors save by replacing the file. `load` is called after the
+    files have stopped changing for `settle` seconds; whatever it returns
+    is handed out once by `poll`, and an exception from it rejects the
+    change and keeps the running settings.
+    """
+
+    def __init__(self, paths, load, interval=1.0, settle=0.2):
+        self.paths = [os.path.abspath(path) for path in paths if path]
+        self.load = load
+        self.interval = interval
+        self.settle = settle
+        self.reloads = 0
+        self.rejected = 0
+        self._stamps = {path: _file_stamp(path) for path in self.paths}
+        self._pending = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._inotify = None
+
+    def _open_inotify(self):
+        try:
+            from inotify_simple import INotify, flags
+        except ImportError:
+            return None
+        inotify = INotify()
+        mask = flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE | flags.DELETE
+        for directory in {os.path.dirname(path) for path in self.paths}:
+            inotify.add_watch(directory, mask)
+        return inotify
+
+    def _wait(self):
+        if self._inotify is None:
+            self._stop_event.wait(self.interval)
+            return
+        # Any event in the watched directories wakes up the stamp check; the timeout keeps stop() responsive.
+        self._inotify.read(timeout=int(self.interval * 1000))
+
+    def _changed(self):
+        stamps = {path: _file_stamp(path) for path in self.paths}
+        if stamps == self._stamps:
+            return False
+        # Let the writer finish before reading half-written files.
+        while not self._stop_event.wait(self.settle):
+            settled = {path: _file_stamp(path) for path in self.paths}
+            if settled == stamps:
+                break
+            stamps = settled
+        self._stamps = stamps
+        return True
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wait()
+            if self._stop_event.is_set() or not self._changed():
+                continue
+            try:
+                settings = self.load()
+            except Exception as e:
+                self.rejected += 1
+                print(f"Config reload rejected, keeping the running settings: {e}")
+                continue
+            with self._lock:
+                self._pending = settings
+            self.reloads += 1
+            print("Config reloaded.")
+
+    def start(self):
+        try:
+            self._inotify = self._open_inotify()
+        except OSError as e:
+            print(f"inotify is not available ({e}), polling for config changes.")
+            self._inotify = None
+        self._thread = threading.Thread(target=self._run, name="config-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def poll(self):
+        """The settings of the latest accepted reload, or None if nothing changed since the last call."""
+        with self._lock:
+            settings, self._pending = self._pending, None
+        return settings
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1.0)
+            self._thread = None
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
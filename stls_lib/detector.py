@@ -0,0 +1,113 @@
+import threading
+
+import numpy as np
+
+
+class Detections:
+    """
+    Columnar view of a (N, 6) x1, y1, x2, y2, score, class id box array.
+    Extra columns, such as the track ids of IoUTracker, are kept as they are.
+
+    The columns are computed once when the batch is built, so the zone
+    lookup reads them instead of unpacking the boxes again. It still
+    behaves like the box array for code that indexes or converts it.
+    """
+
+    __slots__ = ("data", "xyxy", "scores", "class_ids", "coords", "centers")
+
+    def __init__(self, data):
+        data = np.asarray(data)
+        if len(data) == 0:
+            data = np.zeros((0, 6), dtype=np.float32)
+        self.data = np.ascontiguousarray(data if data.dtype.kind == "f" else data.astype(np.float32))
+        self.xyxy = self.data[:, :4]
+        self.scores = self.data[:, 4]
+        self.class_ids = self.data[:, 5].astype(np.int64)
+        self._set_coords()
+
+    def _set_coords(self):
+        self.coords = self.xyxy.astype(np.int64)
+        self.centers = np.empty((len(self.data), 2), dtype=np.int64)
+        np.floor_divide(self.coords[:, 0] + self.coords[:, 2], 2, out=self.centers[:, 0])
+        np.floor_divide(self.coords[:, 1] + self.coords[:, 3], 2, out=self.centers[:, 1])
+
+    def to_frame(self, transform=None, box_scale=None):
+        """
+        Map the boxes to frame coordinates in place: from a letterbox_roi
+        image with its `transform`, as stls.map_boxes_to_frame does, then up
+        from the lores image by `box_scale`, in one pass. The coordinate
+        columns are recomputed once. Returns self.
+        """
+        if len(self.data) == 0 or (transform is None and box_scale is None):
+            return self
+        scale_x = scale_y = 1.0
+        offset_x = offset_y = 0.0
+        if transform is not None:
+            scale, pad_x, pad_y, roi_x, roi_y = transform
+            scale_x = scale_y = 1.0 / scale
+            offset_x, offset_y = roi_x - pad_x / scale, roi_y - pad_y / scale
+        if box_scale is not None:
+            scale_x, offset_x = scale_x * box_scale[0], offset_x * box_scale[0]
+            scale_y, offset_y = scale_y * box_scale[1], offset_y * box_scale[1]
+        self.xyxy[:, 0::2] *= scale_x
+        self.xyxy[:, 0::2] += offset_x
+        self.xyxy[:, 1::2] *= scale_y
+        self.xyxy[:, 1::2] += offset_y
+        self._set_coords()
+        return self
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        return self.data[index]
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None or dtype == self.data.dtype:
+            return self.data.copy() if copy else self.data
+        return self.data.astype(dtype)
+
+
+class Detector:
+    """
+    Quiet wrapper around a YOLO model.
+
+    ultralytics rebuilds the predictor arguments and logs one line per
+    frame on every `predict` call. The first call here goes through
+    `predict` with logging off and the wanted `class_ids` passed on to NMS;
+    later calls with the same confidence and input size reuse that
+    predictor directly. Models without a predictor, such as the benchmark
+    stub, always go through `predict`.
+
+    The model and its predictor are not thread-safe, so every call holds
+    one lock; a stage that predicts while another stage does waits for it.
+    """
+
+    def __init__(self, model, class_ids=None):
+        self.model = model
+        self.class_ids = list(class_ids) if class_ids else None
+        self._args = None
+        self._lock = threading.Lock()
+
+    def _predict(self, images, confidence, imgsz):
+        with self._lock:
+            return self._predict_locked(images, confidence, imgsz)
+
+    def _predict_locked(self, images, confidence, imgsz):
+        predictor = getattr(self.model, "predictor", None)
+        if predictor is not None and self._args == (confidence, imgsz):
+            return predictor(source=images, stream=False)
+
+        options = {} if imgsz is None else {"imgsz": imgsz}
+        results = self.model.predict(source=images, save=False, conf=confidence, classes=self.class_ids, verbose=False, **options)
+        self._args = (confidence, imgsz)
+        return results
+
+    def detect(self, image, confidence, imgsz=None):
+        return self.detect_batch([image], confidence, imgsz)[0]
+
+    def detect_batch(self, images, confidence, imgsz=None):
+        """One predict call over several images, one Detections per image."""
+        if len(images) == 0:
+            return []
+        return [Detections(results.boxes.data.numpy()) for results in self._predict(list(images), confidence, imgsz)]
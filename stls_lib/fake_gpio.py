@@ -0,0 +1,66 @@
+"""
+In-memory stand-in for the subset of RPi.GPIO used by this project.
+
+Every output transition is recorded with its timestamp in `transitions` as
+(time, pin, level), which makes relay timing measurable without hardware.
+"""
+import threading
+import time
+
+BCM = 11
+BOARD = 10
+OUT = 0
+IN = 1
+HIGH = 1
+LOW = 0
+
+pin_levels = {}
+transitions = []
+_lock = threading.Lock()
+
+
+def setmode(mode):
+    pass
+
+
+def setwarnings(flag):
+    pass
+
+
+def setup(channels, direction, initial=None, **kwargs):
+    if not isinstance(channels, (list, tuple)):
+        channels = [channels]
+    for pin in channels:
+        if initial is not None:
+            output(pin, initial)
+        else:
+            pin_levels.setdefault(pin, LOW)
+
+
+def output(channels, levels):
+    if not isinstance(channels, (list, tuple)):
+        channels = [channels]
+    if not isinstance(levels, (list, tuple)):
+        levels = [levels] * len(channels)
+    now = time.time()
+    with _lock:
+        for pin, level in zip(channels, levels):
+            level = int(bool(level))
+            if pin_levels.get(pin) != level:
+                transitions.append((now, pin, level))
+            pin_levels[pin] = level
+
+
+def input(channel):
+    return pin_levels.get(channel, LOW)
+
+
+def cleanup(channels=None):
+    pass
+
+
+def reset():
+    with _lock:
+        pin_levels.clear()
+        transitions.clear()
+
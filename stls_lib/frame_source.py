@@ -0,0 +1,401 @@
+import collections
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+class FrameSource:
+    """
+    Base class for threaded frame sources.
+
+    A background thread keeps grabbing frames into a small ring buffer that
+    drops the oldest frame when full, so `read` always hands out the newest
+    frame without waiting on the capture device.
+    """
+
+    def __init__(self, buffer_size=2):
+        self._buffer = collections.deque(maxlen=max(1, int(buffer_size)))
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._finished = False
+        self._seq = 0
+        self._last_read_seq = 0
+        self.frames_captured = 0
+        self.frames_dropped = 0
+
+    # Backend hooks -----------------------------------------------------------
+    def _open(self):
+        pass
+
+    def _grab(self):
+        """Return the next frame, or None when the source is exhausted."""
+        raise NotImplementedError
+
+    def _close(self):
+        pass
+
+    def _frame_time(self):
+        """Capture time of the frame `_grab` just returned."""
+        return time.time()
+
+    # Public API --------------------------------------------------------------
+    def start(self):
+        if self._running:
+            return self
+        self._open()
+        self._running = True
+        self._finished = False
+        self._thread = threading.Thread(target=self._capture_loop, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2.0)
+        self._thread = None
+        self._close()
+
+    @property
+    def finished(self):
+        return self._finished
+
+    def read(self, timeout=1.0):
+        """
+        Return (seq, capture_time, frame) for the newest frame not read yet.
+        Waits up to `timeout` seconds for a new frame and returns None if the
+        source is exhausted or nothing arrived in time.
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self._seq == self._last_read_seq:
+                if self._finished or not self._running:
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+            seq, capture_time, frame = self._buffer[-1]
+            # Frames that were buffered but never handed out are counted as dropped.
+            self.frames_dropped += seq - self._last_read_seq - 1
+            self._last_read_seq = seq
+            self._buffer.clear()
+        return seq, capture_time, frame
+
+    def _capture_loop(self):
+        while self._running:
+            try:
+                frame = self._grab()
+            except Exception as e:
+                print(f"{type(self).__name__}: capture failed: {e}")
+                frame = None
+            if frame is None:
+                break
+            capture_time = self._frame_time()
+            with self._condition:
+                self._seq += 1
+                self._buffer.append((self._seq, capture_time, frame))
+                self.frames_captured += 1
+                self._condition.notify_all()
+        with self._condition:
+            self._finished = True
+            self._condition.notify_all()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+class FramePool:
+    """
+    Fixed set of preallocated frame buffers handed out round-robin. A buffer
+    is reused `count` frames later, so `count` must be larger than the number
+    of frames that can be alive in the pipeline at once.
+    """
+
+    def __init__(self, shape, dtype=np.uint8, count=8):
+        self.buffers = [np.empty(shape, dtype=dtype) for _ in range(count)]
+        self._index = 0
+
+    def next(self):
+        buffer = self.buffers[self._index]
+        self._index = (self._index + 1) % len(self.buffers)
+        return buffer
+
+
+def get_lores_size(frame_width, frame_height, inference_size):
+    """Low-resolution stream size whose long side is the model input size, keeping the frame's aspect ratio."""
+    scale = inference_size / max(frame_width, frame_height)
+    return (int(round(frame_width * scale / 2)) * 2, int(round(frame_height * scale / 2)) * 2)
+
+
+class PicameraSource(FrameSource):
+    """
+    Picamera2 source. With `capture_mode` "lores" the camera also outputs a
+    low-resolution stream at the model input size, and every frame is an
+    (inference_image, display_frame) tuple taken from the same request:
+    the ISP does the downscaling, the YUV lores image is converted straight
+    into a preallocated BGR buffer and the main stream is only copied out
+    when `keep_main` is set (display or recording).
+    """
+
+    def __init__(self, frame_width, frame_height, buffer_size=2, capture_mode="main", inference_size=640, keep_main=True, pool_size=8):
+        super().__init__(buffer_size)
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+        self.capture_mode = capture_mode
+        self.inference_size = inference_size
+        self.keep_main = keep_main
+        self.pool_size = pool_size
+        self.picam2 = None
+        self._lores_pool = None
+        self._lores_width = None
+        self._main_pool = None
+
+    def _open(self):
+        from picamera2 import Picamera2
+
+        self.picam2 = Picamera2()
+        self.picam2.preview_configuration.main.size = (self.frame_width, self.frame_height)
+        self.picam2.preview_configuration.main.format = "RGB888"
+        if self.capture_mode == "lores":
+            self.picam2.preview_configuration.enable_lores()
+            self.picam2.preview_configuration.lores.size = get_lores_size(self.frame_width, self.frame_height, self.inference_size)
+            self.picam2.preview_configuration.lores.format = "YUV420"
+        self.picam2.preview_configuration.align()
+        self.picam2.configure("preview")
+
+        if self.capture_mode == "lores":
+            lores_config = self.picam2.camera_configuration()["lores"]
+            main_width, main_height = self.picam2.camera_configuration()["main"]["size"]
+            # YUV420 rows are padded to the stride. Converting the whole buffer as a stride wide image keeps the
+            # chroma planes aligned; the padding columns are then cut off the BGR image.
+            self._lores_width = lores_config["size"][0]
+            self._lores_pool = FramePool((lores_config["size"][1], lores_config.get("stride", self._lores_width), 3), count=self.pool_size)
+            if self.keep_main:
+                self._main_pool = FramePool((main_height, main_width, 3), count=self.pool_size)
+        self.picam2.start()
+
+    def _grab(self):
+        if self.capture_mode != "lores":
+            return self.picam2.capture_array()
+
+        from picamera2 import MappedArray
+
+        request = self.picam2.capture_request()
+        try:
+            # MappedArray exposes the camera buffer in place; the only writes are into the preallocated pools.
+            with MappedArray(request, "lores") as lores:
+                image = cv2.cvtColor(lores.array, cv2.COLOR_YUV420p2BGR, dst=self._lores_pool.next())[:, :self._lores_width]
+            display_frame = None
+            if self._main_pool is not None:
+                with MappedArray(request, "main") as main:
+                    display_frame = self._main_pool.next()
+                    np.copyto(display_frame, main.array[:, :display_frame.shape[1], :3])
+        finally:
+            request.release()
+        return image, display_frame
+
+    def _close(self):
+        if self.picam2 is not None:
+            self.picam2.stop()
+            self.picam2 = None
+
+
+class VideoCaptureSource(FrameSource):
+    """
+    cv2.VideoCapture backed source. `video_source` is a file path, a stream
+    URL or a camera index. Files are paced at their native frame rate when
+    `realtime` is set so that playback behaves like a live camera.
+    """
+
+    def __init__(self, video_source, buffer_size=2, realtime=True, loop=False):
+        super().__init__(buffer_size)
+        if isinstance(video_source, str) and video_source.isdigit():
+            video_source = int(video_source)
+        self.video_source = video_source
+        self.realtime = realtime
+        self.loop = loop
+        self.cap = None
+        self._frame_period = 0.0
+        self._next_frame_time = 0.0
+
+    def _open(self):
+        self.cap = cv2.VideoCapture(self.video_source)
+        if not self.cap.isOpened():
+            raise TypeError(f"Cannot open video source '{self.video_source}'.")
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        is_file = isinstance(self.video_source, str) and "://" not in self.video_source
+        self._frame_period = 1.0 / fps if (self.realtime and is_file and fps > 0) else 0.0
+        self._next_frame_time = time.monotonic()
+
+    def _grab(self):
+        if self._frame_period:
+            delay = self._next_frame_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._next_frame_time = max(self._next_frame_time + self._frame_period, time.monotonic() - self._frame_period)
+
+        ok, frame = self.cap.read()
+        if not ok and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self.cap.read()
+        return frame if ok else None
+
+    def _close(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+
+class SyntheticSource(FrameSource):
+    """
+    Generates frames with a few coloured rectangles moving across a grey
+    background. Useful for exercising the pipeline without a camera.
+    """
+
+    def __init__(self, frame_width, frame_height, fps=30.0, buffer_size=2, num_objects=3, max_frames=0):
+        super().__init__(buffer_size)
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+        self.fps = fps
+        self.num_objects = num_objects
+        self.max_frames = max_frames
+        self._index = 0
+        self._next_frame_time = 0.0
+
+    def _open(self):
+        self._index = 0
+        self._next_frame_time = time.monotonic()
+
+    def objects(self, index):
+        """Boxes (x1, y1, x2, y2) of the scripted objects in frame `index`."""
+        box_w = max(8, self.frame_width // 12)
+        box_h = max(8, self.frame_height // 10)
+        span = self.frame_width + box_w
+        boxes = []
+        for i in range(self.num_objects):
+            x = int((index * (4 + 2 * i) + i * span // max(1, self.num_objects)) % span) - box_w
+            y = int((i + 1) * self.frame_height / (self.num_objects + 1)) - box_h // 2
+            boxes.append((x, y, x + box_w, y + box_h))
+        return boxes
+
+    def render(self, index):
+        frame = np.full((self.frame_height, self.frame_width, 3), 90, dtype=np.uint8)
+        for i, (x1, y1, x2, y2) in enumerate(self.objects(index)):
+            color = ((60 * i) % 256, (120 + 50 * i) % 256, (200 - 40 * i) % 256)
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, cv2.FILLED)
+        return frame
+
+    def _grab(self):
+        if self.max_frames and self._index >= self.max_frames:
+            return None
+        if self.fps:
+            delay = self._next_frame_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._next_frame_time += 1.0 / self.fps
+        frame = self.render(self._index)
+        self._index += 1
+        return frame
+
+
+class SharedMemorySource(FrameSource):
+    """
+    Reads the frames another process writes into a SharedFrameRing (see
+    stls_lib.shared_frames), e.g. the capture worker of the supervisor.
+    Frames are copied into a FramePool and keep the writer's capture time.
+    """
+
+    def __init__(self, ring_name, frame_width, frame_height, buffer_size=2, pool_size=8, poll_interval=0.002):
+        super().__init__(buffer_size)
+        self.ring_name = ring_name
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+        self.pool_size = pool_size
+        self.poll_interval = poll_interval
+        self._ring = None
+        self._pool = None
+        self._buffer_frame = None
+        self._last_seq = 0
+        self._last_time = 0.0
+
+    def _open(self):
+        from stls_lib.shared_frames import SharedFrameRing
+
+        self._ring = SharedFrameRing.attach(self.ring_name)
+        if self._ring.shape != (self.frame_height, self.frame_width, 3):
+            shape = self._ring.shape
+            self._ring.close()
+            raise ValueError(f"Shared frame ring '{self.ring_name}' holds {shape[1]}x{shape[0]} frames, expected {self.frame_width}x{self.frame_height}.")
+        self._pool = FramePool(self._ring.shape, count=self.pool_size)
+        self._buffer_frame = self._pool.next()
+
+    def _grab(self):
+        while self._running:
+            result = self._ring.read(self._last_seq, self._buffer_frame)
+            if result is None:
+                if self._ring.closed:
+                    return None
+                time.sleep(self.poll_interval)
+                continue
+            seq, self._last_time = result
+            if self._last_seq and seq - self._last_seq > 1:
+                # Frames the writer put in the ring but this reader never saw.
+                with self._condition:
+                    self.frames_dropped += seq - self._last_seq - 1
+            self._last_seq = seq
+            # The pool only moves on once a buffer holds a frame, so polling never recycles a buffer early.
+            frame, self._buffer_frame = self._buffer_frame, self._pool.next()
+            return frame
+        return None
+
+    def _frame_time(self):
+        return self._last_time
+
+    def _close(self):
+        if self._ring is not None:
+            self._ring.close()
+            self._ring = None
+
+
+def get_capture_mode(kind, capture_mode):
+    """
+    The capture mode a source of `kind` runs with. "lores" (dual-stream
+    capture) is only available on the Pi camera; other sources use "main".
+    """
+    capture_mode = str(capture_mode).lower()
+    if capture_mode not in ("main", "lores"):
+        raise ValueError(f"Unknown capture_mode '{capture_mode}'. Expected one of ['main', 'lores'].")
+    return capture_mode if str(kind).lower() == "picamera" else "main"
+
+
+def create_frame_source(kind, frame_width, frame_height, video_source=None, buffer_size=2, capture_mode="main", inference_size=640, keep_main=True, pool_size=8):
+    """
+    Build a frame source from the `frame_source` setting in root_data.txt.
+    `capture_mode` "lores" falls back to "main" for sources other than the Pi camera.
+    """
+    kind = str(kind).lower()
+    capture_mode = get_capture_mode(kind, capture_mode)
+    if kind == "picamera":
+        return PicameraSource(frame_width, frame_height, buffer_size=buffer_size, capture_mode=capture_mode,
+                              inference_size=inference_size, keep_main=keep_main, pool_size=pool_size)
+    if kind == "video":
+        if not video_source:
+            raise ValueError("frame_source 'video' requires a video_source.")
+        return VideoCaptureSource(video_source, buffer_size=buffer_size)
+    if kind == "synthetic":
+        return SyntheticSource(frame_width, frame_height, buffer_size=buffer_size)
+    if kind == "shared":
+        # Frames written by another process; video_source is the name of the shared frame ring.
+        if not video_source:
+            raise ValueError("frame_source 'shared' requires the ring name as video_source.")
+        return SharedMemorySource(video_source, frame_width, frame_height, buffer_size=buffer_size, pool_size=pool_size)
+    raise ValueError(f"Unknown frame_source '{kind}'. Expected one of ['picamera', 'video', 'synthetic', 'shared'].")
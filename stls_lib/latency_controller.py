@@ -0,0 +1,110 @@
+import collections
+import time
+
+import numpy as np
+
+
+def parse_int_list(value):
+    """Parse a setting such as "640,480,320" into [640, 480, 320]."""
+    if isinstance(value, (int, float)):
+        return [int(value)]
+    return [int(item) for item in str(value).split(",") if item.strip()]
+
+
+class LatencyController:
+    """
+    Keep the decision latency under `target_latency` seconds.
+
+    Operating points are ordered from best quality to cheapest by estimated
+    cost (input pixels / stride), keeping only the (input size, stride)
+    combinations whose input size is not larger than that of the point
+    before, so stepping down never grows the input again. The controller
+    starts at the configured `input_size` and `stride` with overlays on;
+    the first step down turns overlays off, the points above it keep them
+    on. When the p90 of the last
+    `window` latencies is above the target the controller steps to a cheaper
+    point; it steps back only once the p90 has stayed below
+    `recover_ratio * target_latency` for `recover_seconds`. After every
+    change it holds for `hold_seconds` so the window fills with latencies
+    measured at the new point.
+    """
+
+    def __init__(self, target_latency, input_sizes=(640,), strides=(1, 2, 3), window=30, hold_seconds=3.0,
+                 recover_ratio=0.7, recover_seconds=10.0, on_change=None, input_size=None, stride=None):
+        self.target_latency = target_latency
+        self.window = window
+        self.hold_seconds = hold_seconds
+        self.recover_ratio = recover_ratio
+        self.recover_seconds = recover_seconds
+        self.on_change = on_change
+
+        input_size = max(input_sizes) if input_size is None else input_size
+        stride = min(strides) if stride is None else stride
+        cost = lambda point: point[0] * point[0] / point[1]
+        start_point = (input_size, stride)
+        combinations = sorted(
+            ((size, point_stride) for size in set(input_sizes) | {input_size} for point_stride in set(strides) | {stride}),
+            key=lambda point: (-cost(point), -point[0]),
+        )
+        # The configured point is always on the ladder: dearer points never use a smaller input, cheaper ones never a larger one.
+        above = [point for point in combinations if cost(point) > cost(start_point) and point[0] >= input_size]
+        below = [point for point in combinations if cost(point) < cost(start_point) and point[0] <= input_size]
+        ladder = []
+        for point in above + [start_point] + below:
+            if not ladder or point[0] <= ladder[-1][0]:
+                ladder.append(point)
+
+        start = ladder.index(start_point)
+        self.points = [{"input_size": size, "stride": point_stride, "draw": True} for size, point_stride in ladder[:start + 1]]
+        self.points += [{"input_size": size, "stride": point_stride, "draw": False} for size, point_stride in ladder[start:]]
+        self.level = start
+        self.changes = 0
+
+        self._latencies = collections.deque(maxlen=window)
+        self._changed_at = 0.0
+        self._below_since = None
+
+    @property
+    def operating_point(self):
+        return dict(self.points[self.level], level=self.level)
+
+    def _set_level(self, level, now, p90):
+        self.level = level
+        self.changes += 1
+        self._changed_at = now
+        self._below_since = None
+        self._latencies.clear()
+        if self.on_change is not None:
+            self.on_change(self.operating_point, p90)
+
+    def observe(self, latency, now=None):
+        """Record one decision latency. Returns True when the operating point changed."""
+        now = time.monotonic() if now is None else now
+        self._latencies.append(latency)
+        if len(self._latencies) < self.window or now - self._changed_at < self.hold_seconds:
+            return False
+
+        p90 = float(np.percentile(self._latencies, 90))
+        if p90 > self.target_latency:
+            self._below_since = None
+            if self.level < len(self.points) - 1:
+                self._set_level(self.level + 1, now, p90)
+                return True
+            return False
+
+        if p90 < self.recover_ratio * self.target_latency and self.level > 0:
+            if self._below_since is None:
+                self._below_since = now
+            elif now - self._below_since >= self.recover_seconds:
+                self._set_level(self.level - 1, now, p90)
+                return True
+        else:
+            self._below_since = None
+        return False
+
+
+def create_latency_controller(latency_target, input_sizes, strides, on_change=None, input_size=None, stride=None):
+    if not latency_target or float(latency_target) <= 0:
+        return None
+    return LatencyController(float(latency_target), parse_int_list(input_sizes), parse_int_list(strides), on_change=on_change,
+                             input_size=input_size, stride=stride)
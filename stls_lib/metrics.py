@@ -0,0 +1,250 @@
+"""
+Runtime instrumentation with bounded memory.
+
+Timings go into fixed-bucket histograms and events into counters, so the
+memory used does not grow with uptime. The registry can be served in
+Prometheus text format over HTTP and dumped to a JSON file periodically,
+which is how headless devices are monitored.
+"""
+import bisect
+import contextlib
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds, from 1 ms to 5 s.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+THERMAL_ZONE_PATH = "/sys/class/thermal/thermal_zone0/temp"
+THROTTLED_PATH = "/sys/devices/platform/soc/soc:firmware/get_throttled"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in sorted(labels.items())) + "}"
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate a quantile from the buckets (upper bound of the matching bucket)."""
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return float("inf")
+
+
+class MetricsRegistry:
+    def __init__(self, prefix="stls"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._help = {}
+
+    def _key(self, name, labels):
+        return (f"{self.prefix}_{name}", tuple(sorted((labels or {}).items())))
+
+    def describe(self, name, text):
+        self._help[f"{self.prefix}_{name}"] = text
+
+    def observe(self, name, value, labels=None):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name, labels=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, labels)
+
+    def time_stage(self, stage):
+        return self.timer("stage_seconds", {"stage": stage})
+
+    def inc(self, name, amount=1, labels=None):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set_counter(self, name, value, labels=None):
+        """Mirror a running total kept elsewhere, such as the frame count of a capture thread."""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = value
+
+    def set_gauge(self, name, value, labels=None):
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def sample_system(self):
+        """Record CPU temperature and the firmware throttle flags when available."""
+        try:
+            with open(THERMAL_ZONE_PATH, 'r') as f:
+                self.set_gauge("cpu_temperature_celsius", int(f.read().strip()) / 1000.0)
+        except (OSError, ValueError):
+            pass
+        try:
+            with open(THROTTLED_PATH, 'r') as f:
+                self.set_gauge("throttled_flags", int(f.read().strip(), 16))
+        except (OSError, ValueError):
+            pass
+
+    def render_prometheus(self):
+        lines = []
+        declared = set()
+
+        def declare(name, kind):
+            if name in declared:
+                return
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+            declared.add(name)
+
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                declare(name, "counter")
+                lines.append(f"{name}{_format_labels(dict(labels))} {value}")
+            for (name, labels), value in sorted(self._gauges.items()):
+                declare(name, "gauge")
+                lines.append(f"{name}{_format_labels(dict(labels))} {value}")
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                declare(name, "histogram")
+                labels = dict(labels)
+                cumulative = 0
+                bounds = [str(bound) for bound in histogram.buckets] + ["+Inf"]
+                for bound, bucket_count in zip(bounds, histogram.counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_format_labels(dict(labels, le=bound))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        def label_key(name, labels):
+            return name + _format_labels(dict(labels))
+
+        with self._lock:
+            return {
+                "time": time.time(),
+                "counters": {label_key(name, labels): value for (name, labels), value in self._counters.items()},
+                "gauges": {label_key(name, labels): value for (name, labels), value in self._gauges.items()},
+                "histograms": {
+                    label_key(name, labels): {
+                        "count": histogram.count,
+                        "sum": histogram.sum,
+                        "p50": histogram.quantile(0.5),
+                        "p95": histogram.quantile(0.95),
+                        "p99": histogram.quantile(0.99),
+                    }
+                    for (name, labels), histogram in self._histograms.items()
+                },
+            }
+
+
+class MetricsServer:
+    """
+    Serves the registry on http://<host>:<port>/metrics from a daemon thread
+    and, if `json_path` is set, rewrites that file every `interval` seconds.
+    """
+
+    def __init__(self, registry, host="127.0.0.1", port=0, json_path=None, interval=10.0):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.json_path = json_path
+        self.interval = interval
+        self._server = None
+        self._stop_event = threading.Event()
+        self._threads = []
+
+    def _make_handler(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                registry.sample_system()
+                body = registry.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def write_json(self):
+        self.registry.sample_system()
+        tmp_path = f"{self.json_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.registry.snapshot(), f, indent=2)
+        os.replace(tmp_path, self.json_path)
+
+    def _json_loop(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.write_json()
+            except OSError as e:
+                print(f"Cannot write metrics to '{self.json_path}': {e}")
+
+    def start(self):
+        if self.port:
+            self._server = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+            self._server.daemon_threads = True
+            thread = threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+            print(f"Metrics available at http://{self.host}:{self._server.server_address[1]}/metrics")
+        if self.json_path:
+            thread = threading.Thread(target=self._json_loop, name="metrics-json", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self.json_path:
+            try:
+                self.write_json()
+            except OSError:
+                pass
+
+
+# Process-wide registry used by the main loop.
+registry = MetricsRegistry()
@@ -0,0 +1,112 @@
+import hashlib
+import os
+import shutil
+import time
+
+import numpy as np
+
+MODEL_BACKENDS = ["pytorch", "onnx", "openvino", "ncnn"]
+QUANTIZE_MODES = ["none", "fp16", "int8"]
+
+# Backends that ultralytics can quantize on export, per mode. int8 is not offered: its calibration would run on
+# ultralytics' default dataset instead of images of this project's classes.
+SUPPORTED_QUANTIZE = {
+    "onnx": ["none", "fp16"],
+    "openvino": ["none", "fp16"],
+    "ncnn": ["none", "fp16"],
+}
+
+
+def hash_file(file_path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_cache_path(weights_file_path, backend, input_size, quantize):
+    """
+    Location of the exported artifact, next to the weights. The name carries
+    a hash of the weights and the input size so a retrained model or a new
+    input size never picks up a stale export. OpenVINO and NCNN exports keep
+    the `_<backend>_model` suffix that ultralytics uses to recognise them.
+    """
+    weights_dir = os.path.dirname(os.path.abspath(weights_file_path))
+    stem = os.path.splitext(os.path.basename(weights_file_path))[0]
+    key = hash_file(weights_file_path)[:12]
+    if backend == "onnx":
+        name = f"{stem}_{quantize}_{input_size}_{key}.onnx"
+    else:
+        name = f"{stem}_{quantize}_{input_size}_{key}_{backend}_model"
+    return os.path.join(weights_dir, name)
+
+
+def export_model(weights_file_path, backend, input_size, quantize, cache_path):
+    from ultralytics import YOLO
+
+    print(f"Exporting '{weights_file_path}' to {backend} ({quantize}, {input_size}px). This only happens once.")
+    model = YOLO(weights_file_path, "v11")
+    exported_path = model.export(
+        format=backend,
+        imgsz=input_size,
+        half=quantize == "fp16",
+    )
+    if os.path.isdir(cache_path):
+        shutil.rmtree(cache_path)
+    elif os.path.exists(cache_path):
+        os.remove(cache_path)
+    shutil.move(str(exported_path), cache_path)
+    return cache_path
+
+
+def warmup_model(yolo_model, input_size, runs=2):
+    """Run a few dummy frames through the model so the first real frame is not the slow one."""
+    dummy = np.zeros((input_size, input_size, 3), dtype=np.uint8)
+    start = time.time()
+    for _ in range(runs):
+        yolo_model.predict(source=[dummy], save=False, imgsz=input_size, verbose=False)
+    print(f"Model warm-up took {(time.time() - start) * 1000:.0f} ms")
+
+
+def resolve_model_path(weights_file_path, backend="pytorch", input_size=640, quantize="none"):
+    """
+    Path of the model file to load for `backend`: the weights themselves for
+    pytorch, otherwise the cached export, which is built first when missing.
+    """
+    backend = str(backend).lower()
+    quantize = str(quantize).lower()
+    if backend not in MODEL_BACKENDS:
+        raise ValueError(f"Unknown model_backend '{backend}'. Expected one of {MODEL_BACKENDS}.")
+    if quantize not in QUANTIZE_MODES:
+        raise ValueError(f"Unknown model_quantize '{quantize}'. Expected one of {QUANTIZE_MODES}.")
+    if quantize == "int8":
+        raise ValueError("model_quantize 'int8' is not supported: calibration would use ultralytics' default dataset "
+                         "instead of images of this project's classes. Use 'fp16' or 'none'.")
+
+    if backend == "pytorch":
+        return weights_file_path
+    if quantize not in SUPPORTED_QUANTIZE[backend]:
+        raise ValueError(f"model_quantize '{quantize}' is not supported by {backend}. Expected one of {SUPPORTED_QUANTIZE[backend]}.")
+    cache_path = get_cache_path(weights_file_path, backend, input_size, quantize)
+    if not os.path.exists(cache_path):
+        export_model(weights_file_path, backend, input_size, quantize, cache_path)
+    else:
+        print(f"Using cached {backend} model '{cache_path}'.")
+    return cache_path
+
+
+def open_model(model_path, backend="pytorch"):
+    """Load a path returned by resolve_model_path."""
+    from ultralytics import YOLO
+
+    if str(backend).lower() == "pytorch":
+        return YOLO(model_path, "v11")
+    return YOLO(model_path, task="detect")
+
+
+def load_model_backend(weights_file_path, backend="pytorch", input_size=640, quantize="none", warmup=True):
+    yolo_model = open_model(resolve_model_path(weights_file_path, backend, input_size, quantize), backend)
+    if warmup:
+        warmup_model(yolo_model, input_size)
+    return yolo_model
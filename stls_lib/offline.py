@@ -0,0 +1,299 @@
+"""
+Bulk offline analysis of recorded footage.
+
+The video is split into chunks that a process pool works through as fast
+as the CPU allows, each worker with its own model and no display or frame
+pacing. Every chunk starts two time_intervals early so the zone queuing
+state is settled when its own frames begin. The results are merged into per-zone,
+per-class count time series, used to tune zones, detect_sensitivity and
+time_interval on hours of footage.
+
+    python -m stls_lib.offline --video src/inference/videos/video.mp4 --workers 4
+"""
+import argparse
+import concurrent.futures
+import csv
+import json
+import multiprocessing
+import os
+import time
+
+import cv2
+import numpy as np
+
+# ZoneQueuing treats a countdown start of 0.0 as "no countdown", so video time starts here.
+VIDEO_TIME_ORIGIN = 1.0
+
+_worker = {}
+
+
+def get_cpu_count():
+    """CPUs this process may run on, which is less than os.cpu_count() under taskset or a container limit."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _init_worker(options):
+    from stls_lib import stls
+    from stls_lib.zone_cache import load_zones
+
+    # Workers already run in parallel; a thread pool per worker only adds contention.
+    cv2.setNumThreads(1)
+    threads = max(1, get_cpu_count() // options["workers"])
+    if options["detector"] == "stub":
+        from stls_lib.benchmark import StubDetector
+
+        model = None  # One stub per chunk, its background model must not leak across chunks.
+    else:
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+        from stls_lib.model_backend import open_model
+
+        model = open_model(options["model_path"], options["model_backend"])
+
+    class_list = stls.load_class_names(options["class_list_file_path"])
+    compiled_zones = load_zones(options["zones_file_path"], options["frame_width"], options["frame_height"])
+    _worker.update(options=options, model=model, class_list=class_list, compiled_zones=compiled_zones)
+    if options["detector"] == "stub":
+        _worker["new_stub"] = lambda: StubDetector(class_id=class_list.index("car") if "car" in class_list else 0)
+
+
+def _predict(frames, detector, options, roi, predict_imgsz):
+    from stls_lib import stls
+
+    if roi is None:
+        return detector.detect_batch(frames, options["detect_sensitivity"], imgsz=predict_imgsz)
+    crops = [stls.letterbox_roi(frame, roi, options["model_input_size"]) for frame in frames]
+    boxes_per_frame = detector.detect_batch([image for image, _ in crops], options["detect_sensitivity"], imgsz=options["model_input_size"])
+    return [boxes.to_frame(transform) for boxes, (_, transform) in zip(boxes_per_frame, crops)]
+
+
+def analyze_chunk(chunk):
+    """
+    Run frames [start, end) of the video through detection, zone counting and
+    queuing. Returns the video time, per-zone per-class counts, queued vehicle
+    and decision changes of every analysed frame.
+    """
+    from stls_lib import stls
+    from stls_lib.detector import Detector
+    from stls_lib.queuing import ZoneQueuing
+
+    options = _worker["options"]
+    class_list = _worker["class_list"]
+    compiled_zones = _worker["compiled_zones"]
+    model = _worker["model"] if _worker["model"] is not None else _worker["new_stub"]()
+    detector = Detector(model, stls.get_vehicle_class_ids(class_list))
+    frame_width, frame_height = options["frame_width"], options["frame_height"]
+    number_of_zones = compiled_zones["number_of_zones"]
+    zone_mask = compiled_zones["zone_mask"]
+    roi = stls.get_zones_roi(compiled_zones["zones"], frame_width, frame_height, options["roi_margin"]) if options["inference_mode"] == "roi" else None
+    predict_imgsz = None if options["model_backend"] == "pytorch" else options["model_input_size"]
+    queuing = ZoneQueuing(number_of_zones, options["time_interval"])
+    fps, frame_stride, batch_size = chunk["fps"], options["frame_stride"], options["batch_size"]
+
+    cap = cv2.VideoCapture(options["video_source"])
+    cap.set(cv2.CAP_PROP_POS_FRAMES, chunk["warmup_start"])
+    times, counts, vehicles, changes = [], [], [], []
+    index = chunk["warmup_start"]
+    batch = []
+
+    def flush():
+        for (frame_index, _), boxes in zip(batch, _predict([frame for _, frame in batch], detector, options, roi, predict_imgsz)):
+            first_vehicle, vehicle_count, _ = stls.find_zone_vehicles(boxes, class_list, zone_mask, number_of_zones)
+            video_time = frame_index / fps
+            vehicle, _, changed = queuing.update(first_vehicle, vehicle_count, VIDEO_TIME_ORIGIN + video_time)
+            if frame_index < chunk["start"]:
+                continue  # Warm-up frames only settle the queuing state.
+            times.append(video_time)
+            counts.append(stls.count_zone_classes(boxes, class_list, zone_mask, number_of_zones))
+            vehicles.append(vehicle)
+            changes.append(changed)
+        batch.clear()
+
+    while index < chunk["end"]:
+        # grab() skips decoding into a BGR image for the frames the stride leaves out.
+        if not cap.grab():
+            break
+        if (index - chunk["warmup_start"]) % frame_stride == 0:
+            ok, frame = cap.retrieve()
+            if not ok:
+                break
+            if frame.shape[1] != frame_width or frame.shape[0] != frame_height:
+                frame = cv2.resize(frame, (frame_width, frame_height))
+            batch.append((index, frame))
+            if len(batch) >= batch_size:
+                flush()
+        index += 1
+    if batch:
+        flush()
+    cap.release()
+
+    return {
+        "start": chunk["start"],
+        "times": np.array(times, dtype=np.float64),
+        "counts": np.array(counts, dtype=np.uint16).reshape(-1, number_of_zones, len(class_list)),
+        "vehicles": np.array(vehicles, dtype=np.int64).reshape(-1, number_of_zones),
+        "changes": np.array(changes, dtype=bool).reshape(-1, number_of_zones),
+    }
+
+
+def split_chunks(frame_count, fps, chunk_seconds, warmup_seconds):
+    chunk_frames = max(1, int(round(chunk_seconds * fps)))
+    warmup_frames = int(round(warmup_seconds * fps))
+    return [
+        {"start": start, "end": min(start + chunk_frames, frame_count), "warmup_start": max(0, start - warmup_frames), "fps": fps}
+        for start in range(0, frame_count, chunk_frames)
+    ]
+
+
+def bucket_series(times, counts, vehicles, changes, bucket_seconds):
+    """
+    Aggregate the per-frame results into buckets of `bucket_seconds`: the mean
+    and maximum count of every class in every zone and how often each zone's
+    queued vehicle switched to that class.
+    """
+    number_of_buckets = int(times[-1] // bucket_seconds) + 1 if len(times) else 0
+    buckets = (times // bucket_seconds).astype(np.int64)
+    shape = (number_of_buckets,) + counts.shape[1:]
+    frames = np.bincount(buckets, minlength=number_of_buckets).astype(np.float64)
+    totals = np.zeros(shape, dtype=np.float64)
+    maxima = np.zeros(shape, dtype=np.int64)
+    decisions = np.zeros(shape, dtype=np.int64)
+    np.add.at(totals, buckets, counts)
+    np.maximum.at(maxima, buckets, counts)
+    frame_index, zone_index = np.nonzero(changes & (vehicles >= 0))
+    np.add.at(decisions, (buckets[frame_index], zone_index, vehicles[frame_index, zone_index]), 1)
+    means = totals / np.maximum(frames, 1.0)[:, None, None]
+    return frames, means, maxima, decisions
+
+
+def write_series_csv(path, class_list, bucket_seconds, frames, means, maxima, decisions):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["time_s", "zone", "class", "frames", "mean_count", "max_count", "decisions"])
+        for bucket, zone_indx, cls_id in np.ndindex(*means.shape):
+            if frames[bucket] == 0:
+                continue
+            writer.writerow([f"{bucket * bucket_seconds:.2f}", zone_indx, class_list[cls_id], int(frames[bucket]),
+                             f"{means[bucket, zone_indx, cls_id]:.3f}", int(maxima[bucket, zone_indx, cls_id]), int(decisions[bucket, zone_indx, cls_id])])
+
+
+def run_offline_analysis(video_source, weight_file_path, class_list_file_path, zones_file_path, detect_sensitivity, time_interval,
+                         frame_width, frame_height, workers=0, chunk_seconds=60.0, bucket_seconds=1.0, output_path="offline_counts.csv",
+                         frame_stride=1, batch_size=8, inference_mode="full", roi_margin=32, model_input_size=640,
+                         model_backend="pytorch", model_quantize="none", detector="yolo"):
+    from stls_lib import stls
+    from stls_lib.zone_cache import load_zones
+
+    cap = cv2.VideoCapture(video_source)
+    if not cap.isOpened():
+        raise TypeError(f"Cannot open video source '{video_source}'.")
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    cap.release()
+    if frame_count <= 0:
+        raise ValueError(f"'{video_source}' does not report a frame count; offline analysis needs a seekable file.")
+
+    workers = workers or get_cpu_count()
+    class_list = stls.load_class_names(class_list_file_path)
+    # Export the model backend and compile the zones once here so the workers only read the caches.
+    model_path = None
+    if detector != "stub":
+        from stls_lib.model_backend import resolve_model_path
+
+        stls.check_exist_file(weight_file_path)
+        model_path = resolve_model_path(weight_file_path, model_backend, model_input_size, model_quantize)
+    if load_zones(zones_file_path, frame_width, frame_height)["number_of_zones"] == 0:
+        raise ValueError(f"'{zones_file_path}' has no zones; offline analysis counts vehicles per zone.")
+    chunks = split_chunks(frame_count, fps, chunk_seconds, warmup_seconds=2 * time_interval)
+    options = {
+        "video_source": video_source, "weight_file_path": weight_file_path, "class_list_file_path": class_list_file_path,
+        "zones_file_path": zones_file_path, "detect_sensitivity": detect_sensitivity, "time_interval": time_interval,
+        "frame_width": frame_width, "frame_height": frame_height, "workers": workers, "frame_stride": max(1, int(frame_stride)),
+        "batch_size": max(1, int(batch_size)), "inference_mode": str(inference_mode).lower(), "roi_margin": roi_margin,
+        "model_input_size": model_input_size, "model_backend": model_backend, "model_quantize": model_quantize, "detector": detector,
+        "model_path": model_path,
+    }
+    print(f"Analysing {frame_count} frames ({frame_count / fps:.0f} s) of '{video_source}' in {len(chunks)} chunks on {workers} workers.")
+
+    start = time.perf_counter()
+    results = []
+    # spawn keeps torch and OpenCV thread pools out of forked children.
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                                initializer=_init_worker, initargs=(options,)) as executor:
+        for result in executor.map(analyze_chunk, chunks):
+            results.append(result)
+            print(f"    chunk at {result['start'] / fps:.0f} s done ({len(results)}/{len(chunks)})")
+    wall_time = time.perf_counter() - start
+
+    times = np.concatenate([result["times"] for result in results])
+    counts = np.concatenate([result["counts"] for result in results])
+    vehicles = np.concatenate([result["vehicles"] for result in results])
+    changes = np.concatenate([result["changes"] for result in results])
+    frames, means, maxima, decisions = bucket_series(times, counts, vehicles, changes, bucket_seconds)
+    write_series_csv(output_path, class_list, bucket_seconds, frames, means, maxima, decisions)
+
+    summary = {
+        "video_source": video_source,
+        "frames_analysed": int(len(times)),
+        "video_seconds": frame_count / fps,
+        "wall_time_s": wall_time,
+        "speedup": (frame_count / fps) / wall_time if wall_time > 0 else 0.0,
+        "decisions": {
+            f"zone {zone_indx}": {class_list[cls_id]: int(decisions[:, zone_indx, cls_id].sum()) for cls_id in np.flatnonzero(decisions[:, zone_indx].sum(axis=0))}
+            for zone_indx in range(decisions.shape[1])
+        },
+        "output_path": output_path,
+    }
+    print(f"Analysed {summary['frames_analysed']} frames in {wall_time:.1f} s ({summary['speedup']:.1f}x real time). "
+          f"Counts written to '{output_path}'.")
+    return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Count vehicles per zone and class over recorded footage with a process pool.")
+    parser.add_argument("--video", required=True)
+    parser.add_argument("--frame-width", type=int, default=1280)
+    parser.add_argument("--frame-height", type=int, default=800)
+    parser.add_argument("--zones", default="src/utils/zones.txt")
+    parser.add_argument("--class-list", default="src/utils/class.names")
+    parser.add_argument("--detector", choices=["stub", "yolo"], default="yolo")
+    parser.add_argument("--weights", default="src/YOLO11_training/train_result/weights/best.pt")
+    parser.add_argument("--backend", default="pytorch")
+    parser.add_argument("--quantize", default="none")
+    parser.add_argument("--input-size", type=int, default=640)
+    parser.add_argument("--inference-mode", choices=["full", "roi"], default="full")
+    parser.add_argument("--roi-margin", type=int, default=32)
+    parser.add_argument("--confidence", type=float, default=0.15)
+    parser.add_argument("--time-interval", type=float, default=3.0)
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes, 0 for one per CPU.")
+    parser.add_argument("--chunk-seconds", type=float, default=60.0)
+    parser.add_argument("--bucket-seconds", type=float, default=1.0)
+    parser.add_argument("--frame-stride", type=int, default=1, help="Analyse every n-th frame.")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--output", default="offline_counts.csv")
+    parser.add_argument("--json", help="Also write the summary to this JSON file.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    summary = run_offline_analysis(
+        args.video, args.weights, args.class_list, args.zones, args.confidence, args.time_interval,
+        args.frame_width, args.frame_height, workers=args.workers, chunk_seconds=args.chunk_seconds,
+        bucket_seconds=args.bucket_seconds, output_path=args.output, frame_stride=args.frame_stride,
+        batch_size=args.batch_size, inference_mode=args.inference_mode, roi_margin=args.roi_margin,
+        model_input_size=args.input_size, model_backend=args.backend, model_quantize=args.quantize, detector=args.detector,
+    )
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+    return summary
+
+
+if __name__ == "__main__":
+    main()
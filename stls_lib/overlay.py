@@ -0,0 +1,50 @@
+import numpy as np
+
+from stls_lib import stls
+
+BOX_COLOR = (86, 179, 255)
+
+
+class OverlayRenderer:
+    """
+    Draw the visualization of one window in a single pass.
+
+    The zones never change between reloads, so their outlines and labels are
+    drawn once into a static layer and only the pixels they cover are copied
+    onto each frame. Detection boxes are blended inside their own rectangles
+    from a preallocated fill image instead of through a copy of the frame.
+    """
+
+    def __init__(self, frame_name, class_list):
+        self.frame_name = frame_name
+        self.class_list = class_list
+        self._zones = None
+        self._layer_shape = None
+        self._layer_points = None
+        self._layer_pixels = None
+        self._box_fill = None
+
+    def _build_zone_layer(self, frame, zones, centroids):
+        layer = np.zeros_like(frame)
+        stls.draw_polylines_zones(layer, zones, self.frame_name, centroids=centroids)
+        self._layer_points = np.nonzero(layer.any(axis=2))
+        self._layer_pixels = layer[self._layer_points]
+        self._box_fill = np.full_like(frame, BOX_COLOR)
+        self._zones = zones
+        self._layer_shape = frame.shape
+
+    def draw(self, frame, zones, centroids, detections, zones_status, processing_time, is_zone_occupied):
+        if self.frame_name.lower() == "off":
+            return
+        # A reload hands over a new zones dict, which is the only time the layer is rebuilt.
+        if zones is not self._zones or frame.shape != self._layer_shape:
+            self._build_zone_layer(frame, zones, centroids)
+
+        frame[self._layer_points] = self._layer_pixels
+        stls.show_objects_info(frame, detections, self.class_list, self.frame_name, fill=self._box_fill)
+        stls.traffic_light_display(frame, is_zone_occupied=is_zone_occupied)
+        stls.display_zone_info(frame, {
+            "frame_name": self.frame_name,
+            "hanlde_current_vehic": zones_status,
+            "processing_time": processing_time,
+        })
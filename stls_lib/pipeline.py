@@ -0,0 +1,205 @@
+import collections
+import threading
+import time
+
+QUEUE_POLICIES = ["block", "drop"]
+
+
+class QueueClosed(Exception):
+    pass
+
+
+class StopPipeline(Exception):
+    """Raised by a stage function to shut the whole pipeline down."""
+
+
+class BoundedQueue:
+    """
+    Small thread-safe FIFO with a fixed capacity.
+
+    policy="block": `put` waits until there is room.
+    policy="drop":  `put` never waits; the oldest queued item is discarded.
+    """
+
+    def __init__(self, maxsize=2, policy="block"):
+        if policy not in QUEUE_POLICIES:
+            raise ValueError(f"Unknown queue policy '{policy}'. Expected one of {QUEUE_POLICIES}.")
+        self.maxsize = max(1, int(maxsize))
+        self.policy = policy
+        self.dropped = 0
+        self._items = collections.deque()
+        self._condition = threading.Condition()
+        self._closed = False
+
+    def __len__(self):
+        with self._condition:
+            return len(self._items)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def put(self, item, timeout=None):
+        """Queue `item`. Returns False if it could not be queued in time."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            if self._closed:
+                raise QueueClosed()
+            if len(self._items) >= self.maxsize:
+                if self.policy == "drop":
+                    self._items.popleft()
+                    self.dropped += 1
+                else:
+                    while len(self._items) >= self.maxsize and not self._closed:
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            return False
+                        self._condition.wait(remaining)
+                    if self._closed:
+                        raise QueueClosed()
+            self._items.append(item)
+            self._condition.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        """
+        Return the next item. Raises QueueClosed once the queue is closed and
+        drained, and TimeoutError if nothing arrived within `timeout`.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while not self._items:
+                if self._closed:
+                    raise QueueClosed()
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError()
+                self._condition.wait(remaining)
+            item = self._items.popleft()
+            self._condition.notify_all()
+            return item
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+class Stage:
+    """
+    One step of a Pipeline.
+
+    The first stage is a producer and is called with no arguments; every other
+    stage is called with the item produced by the stage before it. Returning
+    None drops the item, raising StopPipeline ends the run. `queue_size` and
+    `policy` describe the queue that feeds this stage.
+    """
+
+    def __init__(self, name, func, queue_size=2, policy="block"):
+        self.name = name
+        self.func = func
+        self.queue_size = queue_size
+        self.policy = policy
+        self.processed = 0
+        self.busy_time = 0.0
+
+
+class Pipeline:
+    """
+    Runs stages concurrently, connected by bounded queues. Every stage gets
+    its own thread except the last one when `run_last_on_caller` is set, so
+    that GUI calls such as cv2.imshow stay on the main thread.
+    """
+
+    def __init__(self, stages, run_last_on_caller=True):
+        if not stages:
+            raise ValueError("A pipeline needs at least one stage.")
+        self.stages = list(stages)
+        self.run_last_on_caller = run_last_on_caller and len(self.stages) > 1
+        self.queues = [BoundedQueue(stage.queue_size, stage.policy) for stage in self.stages[1:]]
+        self._stop_event = threading.Event()
+        self._threads = []
+        self.error = None
+
+    @property
+    def stopped(self):
+        return self._stop_event.is_set()
+
+    def stop(self):
+        self._stop_event.set()
+        for q in self.queues:
+            q.close()
+
+    def _call(self, stage, *args):
+        start = time.perf_counter()
+        try:
+            return stage.func(*args)
+        finally:
+            stage.busy_time += time.perf_counter() - start
+            stage.processed += 1
+
+    def _run_stage(self, index):
+        stage = self.stages[index]
+        in_queue = self.queues[index - 1] if index > 0 else None
+        out_queue = self.queues[index] if index < len(self.queues) else None
+        try:
+            while not self._stop_event.is_set():
+                if in_queue is None:
+                    item = self._call(stage)
+                else:
+                    try:
+                        item = in_queue.get(timeout=0.5)
+                    except TimeoutError:
+                        continue
+                    item = self._call(stage, item)
+                if item is None or out_queue is None:
+                    continue
+                while not out_queue.put(item, timeout=0.5):
+                    if self._stop_event.is_set():
+                        return
+        except QueueClosed:
+            pass
+        except StopPipeline:
+            # A producer that runs dry lets downstream stages drain; any other stage stops everything.
+            if in_queue is not None:
+                self.stop()
+        except Exception as e:
+            self.error = e
+            print(f"Pipeline stage '{stage.name}' failed: {e}")
+            self.stop()
+        finally:
+            # Let the next stage drain what is queued and then finish on its own.
+            if out_queue is not None:
+                out_queue.close()
+
+    def start(self):
+        last = len(self.stages) - 1 if self.run_last_on_caller else len(self.stages)
+        for index in range(last):
+            thread = threading.Thread(target=self._run_stage, args=(index,), name=f"stage-{self.stages[index].name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def join(self, timeout=None):
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def run(self):
+        """Start all stages, run the last one here and block until done."""
+        self.start()
+        if self.run_last_on_caller:
+            self._run_stage(len(self.stages) - 1)
+            self.stop()
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+    def stats(self):
+        return {
+            stage.name: {
+                "processed": stage.processed,
+                "busy_ms": stage.busy_time * 1000,
+                "dropped": self.queues[i - 1].dropped if i > 0 else 0,
+            }
+            for i, stage in enumerate(self.stages)
+        }
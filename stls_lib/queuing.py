@@ -0,0 +1,79 @@
+import numpy as np
+
+NO_VEHICLE = -1
+
+
+class ZoneQueuing:
+    """
+    handle_zone_queuing for every zone at once.
+
+    Countdown start, refresh flag and current vehicle of all zones live in
+    NumPy arrays and are updated in one vectorized step per frame:
+
+    - a zone that is not refreshing and has vehicles starts its countdown and
+      takes its first vehicle;
+    - when the countdown of a zone has run for `interval` seconds it stops and
+      the zone takes its first vehicle if more than one is waiting, else none.
+    """
+
+    def __init__(self, number_of_zones, interval):
+        self.number_of_zones = number_of_zones
+        self.interval = interval
+        self.countdown_start = np.zeros(number_of_zones, dtype=np.float64)
+        self.refresh = np.zeros(number_of_zones, dtype=bool)
+        self.vehicle = np.full(number_of_zones, NO_VEHICLE, dtype=np.int64)
+
+    def update(self, first_vehicle, vehicle_count, current_time):
+        """
+        `first_vehicle` holds the class id of the first vehicle in each zone
+        (NO_VEHICLE when empty) and `vehicle_count` the number of vehicles.
+        Returns (vehicle, elapsed, changed) arrays per zone.
+        """
+        first_vehicle = np.asarray(first_vehicle, dtype=np.int64)
+        vehicle_count = np.asarray(vehicle_count)
+        previous = self.vehicle.copy()
+
+        start = ~self.refresh & (vehicle_count > 0)
+        self.refresh |= start
+        self.countdown_start[start] = current_time
+        self.vehicle[start] = first_vehicle[start]
+
+        done = self.refresh & (self.countdown_start != 0.0) & (current_time - self.countdown_start >= self.interval)
+        self.refresh[done] = False
+        self.countdown_start[done] = 0.0
+        self.vehicle[done] = np.where(vehicle_count > 1, first_vehicle, NO_VEHICLE)[done]
+
+        elapsed = np.where(self.countdown_start != 0.0, current_time - self.countdown_start, 0.0)
+        return self.vehicle.copy(), elapsed, self.vehicle != previous
+
+    def status(self, class_list, elapsed):
+        """Per-zone {"vehicle", "current_time"} dicts in the format handle_zone_queuing returns."""
+        return [
+            {
+                "vehicle": class_list[vehicle] if vehicle != NO_VEHICLE else 'none',
+                "current_time": f'{round(float(remaining), 2):.2f}',
+            }
+            for vehicle, remaining in zip(self.vehicle, elapsed)
+        ]
+
+
+def parse_zone_relays(value):
+    """
+    Parse a `zone_relays` setting such as "0=17,27,22; 1=5,6,13" into
+    {zone_index: (car_pin, motorbike_pin, other_pin)}.
+    """
+    if isinstance(value, dict):
+        return dict(value)
+    zone_relays = {}
+    if value is None or str(value).strip().lower() in ("", "none"):
+        return zone_relays
+    for entry in str(value).split(";"):
+        entry = entry.strip()
+        if not entry:
+            continue
+        zone, pins = entry.split("=", 1)
+        pins = tuple(int(pin) for pin in pins.split(","))
+        if len(pins) != 3:
+            raise ValueError(f"zone_relays entry '{entry}' must list 3 pins: car, motorbike, other.")
+        zone_relays[int(zone)] = pins
+    return zone_relays
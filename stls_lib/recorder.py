@@ -0,0 +1,240 @@
+"""
+Event recorder for post-incident analysis.
+
+The frame loop hands every processed frame to `EventRecorder.record`, which
+only keeps a downscaled copy in a preallocated ring and queues the zone
+decisions; nothing on that path touches the disk. Two daemon threads do the
+I/O: one appends the decisions to a compact binary log and one writes a
+clip with `pre_seconds` before and `post_seconds` after every trigger.
+The oldest clips are deleted once the clips take more than
+`clips_max_bytes`, and the decision log rotates at `log_max_bytes`, so a
+recorder left on never fills the disk. When the disk cannot keep up, records are dropped and counted instead of
+slowing the loop down.
+"""
+import collections
+import json
+import math
+import os
+import queue
+import re
+import threading
+import time
+
+import cv2
+import numpy as np
+
+DECISION_LOG_MAGIC = b"STLSDEC1"
+
+# One record per zone per processed frame. vehicle is the class id, -1 when the zone is empty.
+DECISION_DTYPE = np.dtype([
+    ("time", "<f8"),
+    ("zone", "u1"),
+    ("vehicle", "i1"),
+    ("count", "u1"),
+    ("changed", "u1"),
+    ("elapsed", "<f4"),
+])
+
+
+def read_decision_log(path):
+    """Load a decision log written by EventRecorder as a NumPy structured array."""
+    with open(path, 'rb') as f:
+        if f.read(len(DECISION_LOG_MAGIC)) != DECISION_LOG_MAGIC:
+            raise ValueError(f"'{path}' is not a decision log.")
+        return np.frombuffer(f.read(), dtype=DECISION_DTYPE)
+
+
+class EventRecorder:
+    def __init__(self, output_dir, frame_width, frame_height, pre_seconds=5.0, post_seconds=5.0, record_fps=5.0,
+                 record_width=480, log_max_bytes=64 << 20, clips_max_bytes=1 << 30, queue_size=256, name="recorder"):
+        self.output_dir = output_dir
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.record_fps = record_fps
+        self.log_max_bytes = log_max_bytes
+        self.clips_max_bytes = clips_max_bytes
+        self.name = name
+        self.record_size = (int(record_width), int(round(frame_height * record_width / frame_width / 2)) * 2)
+        self.log_path = os.path.join(output_dir, f"{name}_decisions.bin")
+        self.clips_written = 0
+        self.clips_deleted = 0
+        self.decisions_dropped = 0
+
+        # Enough slots for a whole clip, so the pre-event frames are still there when the clip is flushed.
+        capacity = int(math.ceil((pre_seconds + post_seconds) * record_fps)) + 2
+        self._frames = [np.zeros((self.record_size[1], self.record_size[0], 3), dtype=np.uint8) for _ in range(capacity)]
+        self._entries = collections.deque(maxlen=capacity)
+        self._next_slot = 0
+        self._seq = 0
+        self._last_record_time = 0.0
+        self._lock = threading.Lock()
+
+        self._decisions = queue.Queue(maxsize=queue_size)
+        self._event = None
+        self._event_condition = threading.Condition()
+        self._running = False
+        self._threads = []
+
+    def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._running = True
+        for target, name in ((self._write_decisions, "log"), (self._write_clips, "clips")):
+            thread = threading.Thread(target=target, name=f"{self.name}-{name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        self._running = False
+        with self._event_condition:
+            self._event_condition.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=5.0)
+        self._threads = []
+
+    # Frame loop --------------------------------------------------------------
+    def record(self, capture_time, frame, detections, zones_status, vehicle=None, vehicle_count=None, changed=None):
+        """
+        Keep the frame and its detections and zone states in the ring, sampled
+        at `record_fps`, and queue the zone decisions (the queued vehicle
+        class id per zone, as returned by ZoneQueuing.update) for the binary log.
+        """
+        if vehicle is not None:
+            self._queue_decisions(capture_time, vehicle, vehicle_count, changed, zones_status)
+
+        if frame is None or capture_time - self._last_record_time < 1.0 / self.record_fps:
+            return
+        self._last_record_time = capture_time
+        with self._lock:
+            slot = self._next_slot
+            self._next_slot = (slot + 1) % len(self._frames)
+            cv2.resize(frame, self.record_size, dst=self._frames[slot], interpolation=cv2.INTER_AREA)
+            self._seq += 1
+            self._entries.append((self._seq, slot, capture_time, detections, zones_status))
+
+    def _queue_decisions(self, capture_time, vehicle, vehicle_count, changed, zones_status):
+        records = np.empty(len(vehicle), dtype=DECISION_DTYPE)
+        records["time"] = capture_time
+        records["zone"] = np.arange(len(vehicle))
+        records["vehicle"] = vehicle
+        records["count"] = np.minimum(vehicle_count, 255)
+        records["changed"] = changed
+        records["elapsed"] = [float(status["current_time"]) for status in zones_status]
+        try:
+            self._decisions.put_nowait(records.tobytes())
+        except queue.Full:
+            self.decisions_dropped += 1
+
+    def trigger(self, reason, now=None):
+        """
+        Ask for a clip around `now`. A trigger while a clip is still pending
+        extends that clip instead of starting another one.
+        """
+        now = time.time() if now is None else now
+        with self._event_condition:
+            if self._event is None:
+                self._event = {"reason": reason, "time": now, "start": now - self.pre_seconds, "end": now + self.post_seconds}
+            else:
+                self._event["end"] = min(now + self.post_seconds, self._event["start"] + len(self._frames) / self.record_fps)
+                self._event["reason"] += f", {reason}"
+            self._event_condition.notify_all()
+
+    # Background writers ------------------------------------------------------
+    def _open_log(self):
+        if os.path.exists(self.log_path) and os.path.getsize(self.log_path) >= self.log_max_bytes:
+            os.replace(self.log_path, f"{self.log_path}.1")
+        log = open(self.log_path, 'ab')
+        if log.tell() == 0:
+            log.write(DECISION_LOG_MAGIC)
+        return log
+
+    def _write_decisions(self):
+        log = self._open_log()
+        try:
+            while self._running or not self._decisions.empty():
+                try:
+                    chunk = self._decisions.get(timeout=0.5)
+                except queue.Empty:
+                    log.flush()
+                    continue
+                log.write(chunk)
+                if log.tell() >= self.log_max_bytes:
+                    log.close()
+                    log = self._open_log()
+        except OSError as e:
+            print(f"{self.name}: cannot write decision log '{self.log_path}': {e}")
+        finally:
+            log.close()
+
+    def _write_clips(self):
+        while True:
+            with self._event_condition:
+                while self._running and (self._event is None or time.time() < self._event["end"]):
+                    timeout = None if self._event is None else max(0.0, self._event["end"] - time.time())
+                    self._event_condition.wait(timeout)
+                event, self._event = self._event, None
+            if event is not None:
+                try:
+                    self._write_clip(event)
+                except (OSError, cv2.error) as e:
+                    print(f"{self.name}: cannot write clip: {e}")
+            if not self._running:
+                return
+
+    def _write_clip(self, event):
+        # Copy the frames out one at a time so the frame loop only ever waits for a single small copy.
+        with self._lock:
+            entries = [entry for entry in self._entries if event["start"] <= entry[2] <= event["end"]]
+        frames = []
+        for seq, slot, capture_time, detections, zones_status in entries:
+            with self._lock:
+                if not self._entries or self._entries[0][0] > seq:
+                    continue  # Overwritten since the snapshot.
+                frames.append((capture_time, self._frames[slot].copy(), detections, zones_status))
+        if not frames:
+            return
+
+        stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(event["time"]))
+        base_path = os.path.join(self.output_dir, f"{self.name}_{stamp}")
+        writer = cv2.VideoWriter(f"{base_path}.mp4", cv2.VideoWriter_fourcc(*"mp4v"), self.record_fps, self.record_size)
+        try:
+            for _, frame, _, _ in frames:
+                writer.write(frame)
+        finally:
+            writer.release()
+
+        # Detections stay in frame coordinates; record_size is the size of the clip.
+        with open(f"{base_path}.json", 'w') as f:
+            json.dump({
+                "reason": event["reason"],
+                "time": event["time"],
+                "record_size": list(self.record_size),
+                "frames": [
+                    {
+                        "time": capture_time,
+                        "detections": [[int(x1), int(y1), int(x2), int(y2), int(cls), float(conf)] for x1, y1, x2, y2, cls, conf, _ in detections],
+                        "zones": zones_status,
+                    }
+                    for capture_time, _, detections, zones_status in frames
+                ],
+            }, f)
+        self.clips_written += 1
+        print(f"{self.name}: saved clip '{base_path}.mp4' ({event['reason']}).")
+        self._prune_clips()
+
+    def _prune_clips(self):
+        """Delete the oldest clips until the clips of this recorder fit in `clips_max_bytes`."""
+        pattern = re.compile(re.escape(self.name) + r"_\d{8}_\d{6}\.(mp4|json)$")
+        paths = [os.path.join(self.output_dir, file_name) for file_name in os.listdir(self.output_dir) if pattern.match(file_name)]
+        clips = {}
+        for path in paths:
+            clips.setdefault(os.path.splitext(path)[0], []).append(path)
+        total = sum(os.path.getsize(path) for path in paths)
+        # The time stamp in the name sorts the clips oldest first; the clip just written is always kept.
+        for base_path in sorted(clips)[:-1]:
+            if total <= self.clips_max_bytes:
+                break
+            for path in clips[base_path]:
+                total -= os.path.getsize(path)
+                os.remove(path)
+            self.clips_deleted += 1
@@ -0,0 +1,165 @@
+import threading
+import time
+
+RELAY_BACKENDS = ["rpi", "lgpio", "fake"]
+
+# Relays are active low: a pin driven LOW switches its relay on.
+HIGH = 1
+LOW = 0
+RELAY_STATES = {
+    "car": (LOW, HIGH, HIGH),
+    "motorbike": (HIGH, LOW, HIGH),
+    "none": (HIGH, HIGH, LOW),
+}
+
+
+class GPIOBackend:
+    """Backend for RPi.GPIO and modules with the same API, such as stls_lib.fake_gpio."""
+
+    def __init__(self, gpio):
+        self.gpio = gpio
+        self.gpio.setwarnings(False)
+        self.gpio.setmode(gpio.BCM)
+
+    def setup(self, pins, levels):
+        for pin, level in zip(pins, levels):
+            self.gpio.setup(pin, self.gpio.OUT, initial=level)
+
+    def write(self, pins, levels):
+        # RPi.GPIO accepts a list of channels and values in one call.
+        self.gpio.output(list(pins), list(levels))
+
+    def close(self):
+        self.gpio.cleanup()
+
+
+class LgpioBackend:
+    """Backend for lgpio. Every relay group is claimed as a GPIO group and written with one call."""
+
+    def __init__(self, chip=0):
+        import lgpio
+
+        self.lgpio = lgpio
+        self.handle = lgpio.gpiochip_open(chip)
+        self._groups = {}
+
+    def setup(self, pins, levels):
+        pins = list(pins)
+        self.lgpio.group_claim_output(self.handle, pins, list(levels))
+        self._groups[tuple(pins)] = pins[0]
+
+    def write(self, pins, levels):
+        group = self._groups.get(tuple(pins))
+        if group is None:
+            for pin, level in zip(pins, levels):
+                self.lgpio.gpio_write(self.handle, pin, level)
+            return
+        bits = sum(level << i for i, level in enumerate(levels))
+        self.lgpio.group_write(self.handle, group, bits, (1 << len(pins)) - 1)
+
+    def close(self):
+        for group in self._groups.values():
+            self.lgpio.group_free(self.handle, group)
+        self.lgpio.gpiochip_close(self.handle)
+
+
+def create_relay_backend(kind):
+    kind = str(kind).lower()
+    if kind == "rpi":
+        import RPi.GPIO as GPIO
+        return GPIOBackend(GPIO)
+    if kind == "lgpio":
+        return LgpioBackend()
+    if kind == "fake":
+        from stls_lib import fake_gpio
+        return GPIOBackend(fake_gpio)
+    raise ValueError(f"Unknown relay_backend '{kind}'. Expected one of {RELAY_BACKENDS}.")
+
+
+class RelayActuator:
+    """
+    Drives one group of (car, motorbike, other) relays.
+
+    `request` only records the wanted state and returns immediately; a worker
+    thread applies it. A new state has to be requested continuously for
+    `debounce` seconds before it is applied, and an applied state is held for
+    at least `min_dwell` seconds, so flickering detections do not make the
+    relays chatter. All pins of a state are written as one operation.
+    """
+
+    def __init__(self, backend, relay_pins, debounce=0.2, min_dwell=1.0, on_switch=None, start_worker=True):
+        self.backend = backend
+        self.relay_pins = tuple(relay_pins)
+        self.debounce = debounce
+        self.min_dwell = min_dwell
+        self.on_switch = on_switch
+        self.state = "none"
+        self.switches = 0
+        self._applied_at = float("-inf")
+        self._requested = "none"
+        self._requested_at = 0.0
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+
+        self.backend.setup(self.relay_pins, RELAY_STATES["none"])
+        if start_worker:
+            self.start()
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._worker, name=f"relay-{self.relay_pins[0]}", daemon=True)
+        self._thread.start()
+
+    def request(self, vehicle_type, now=None):
+        if vehicle_type not in RELAY_STATES:
+            vehicle_type = "none"
+        now = time.monotonic() if now is None else now
+        with self._condition:
+            if vehicle_type != self._requested:
+                self._requested = vehicle_type
+                self._requested_at = now
+                self._condition.notify()
+
+    def step(self, now=None):
+        """
+        Apply the requested state if debounce and dwell allow it. Returns the
+        number of seconds until the next check is useful, or None when idle.
+        """
+        now = time.monotonic() if now is None else now
+        with self._condition:
+            requested, requested_at = self._requested, self._requested_at
+        if requested == self.state:
+            return None
+
+        wait = max(requested_at + self.debounce - now, self._applied_at + self.min_dwell - now)
+        if wait > 0:
+            return wait
+
+        self.backend.write(self.relay_pins, RELAY_STATES[requested])
+        self.state = requested
+        self._applied_at = now
+        self.switches += 1
+        if self.on_switch is not None:
+            self.on_switch(requested)
+        return None
+
+    def _worker(self):
+        while self._running:
+            wait = self.step()
+            with self._condition:
+                if not self._running:
+                    break
+                if self._requested == self.state or wait is not None:
+                    self._condition.wait(wait if wait is not None else 1.0)
+
+    def stop(self, reset=True):
+        self._running = False
+        with self._condition:
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        if reset:
+            self.backend.write(self.relay_pins, RELAY_STATES["none"])
+            self.state = "none"
@@ -0,0 +1,359 @@
+"""
+Offload inference to a better machine on the local network.
+
+The server loads the model once and answers JPEG-compressed images sent
+over TCP or a Unix socket; requests from all connected clients are batched
+into one predict call. The client keeps several requests in flight so the
+Pi can capture and decide on other frames while the server works, and the
+caller falls back to on-device inference whenever a result is late or the
+server cannot be reached.
+
+    python -m stls_lib.remote_inference --listen tcp://0.0.0.0:9200 --weights best.pt
+    python -m stls_lib.remote_inference --listen unix:///tmp/stls-inference.sock --weights best.pt
+
+Messages are little-endian: a request is (magic, request id, confidence,
+imgsz, payload length) followed by the JPEG, a response is (magic, request
+id, status, number of boxes) followed by N x 6 float32 boxes.
+"""
+import argparse
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+import cv2
+import numpy as np
+
+REQUEST_HEADER = struct.Struct("<4sIfHI")
+RESPONSE_HEADER = struct.Struct("<4sIBI")
+REQUEST_MAGIC = b"STLQ"
+RESPONSE_MAGIC = b"STLR"
+STATUS_OK = 0
+STATUS_ERROR = 1
+MAX_PAYLOAD = 16 << 20
+
+
+def parse_address(address):
+    """'tcp://host:port', 'host:port' or 'unix:///path' -> (socket family, address)."""
+    address = str(address)
+    if address.startswith("unix://"):
+        return socket.AF_UNIX, address[len("unix://"):]
+    if address.startswith("tcp://"):
+        address = address[len("tcp://"):]
+    host, port = address.rsplit(":", 1)
+    return socket.AF_INET, (host, int(port))
+
+
+def recv_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed.")
+        data += chunk
+    return bytes(data)
+
+
+def send_response(sock, lock, request_id, boxes, status=STATUS_OK):
+    boxes = np.ascontiguousarray(boxes, dtype=np.float32).reshape(-1, 6)
+    with lock:
+        sock.sendall(RESPONSE_HEADER.pack(RESPONSE_MAGIC, request_id, status, len(boxes)) + boxes.tobytes())
+
+
+# Server ----------------------------------------------------------------------
+class _TCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class InferenceServer:
+    """
+    Decodes requests on one thread per connection and runs them through the
+    model from a single batching thread: it takes whatever requests arrived
+    within `batch_wait` seconds, up to `max_batch`, and predicts them together.
+    """
+
+    def __init__(self, model, address, max_batch=8, batch_wait=0.005):
+        self.model = model
+        self.family, self.address = parse_address(address)
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait
+        self.batches = 0
+        self.requests = 0
+        self._queue = queue.Queue()
+        self._running = False
+        self._server = None
+        self._threads = []
+
+    def _make_handler(self):
+        pending = self._queue
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                lock = threading.Lock()
+                try:
+                    while True:
+                        magic, request_id, confidence, imgsz, size = REQUEST_HEADER.unpack(recv_exact(self.request, REQUEST_HEADER.size))
+                        if magic != REQUEST_MAGIC or size > MAX_PAYLOAD:
+                            return
+                        image = cv2.imdecode(np.frombuffer(recv_exact(self.request, size), dtype=np.uint8), cv2.IMREAD_COLOR)
+                        if image is None:
+                            send_response(self.request, lock, request_id, [], STATUS_ERROR)
+                            continue
+                        pending.put((self.request, lock, request_id, confidence, imgsz, image))
+                except (ConnectionError, OSError):
+                    return
+
+        return Handler
+
+    def _predict(self, batch):
+        from stls_lib import stls
+
+        # One predict call per input size; the lowest confidence of the batch is used and each client's is applied after.
+        by_imgsz = {}
+        for item in batch:
+            by_imgsz.setdefault(item[4], []).append(item)
+        for imgsz, items in by_imgsz.items():
+            confidence = min(item[3] for item in items)
+            try:
+                boxes_per_image = stls.get_prediction_boxes_batch([item[5] for item in items], self.model, confidence, imgsz=imgsz or None)
+            except Exception as e:
+                print(f"Inference failed: {e}")
+                boxes_per_image = [None] * len(items)
+            for (sock, lock, request_id, item_confidence, _, _), boxes in zip(items, boxes_per_image):
+                try:
+                    if boxes is None:
+                        send_response(sock, lock, request_id, [], STATUS_ERROR)
+                    else:
+                        send_response(sock, lock, request_id, boxes[boxes[:, 4] >= item_confidence] if len(boxes) else boxes)
+                except OSError:
+                    pass  # The client went away; its other requests fail on their own.
+
+    def _batch_loop(self):
+        while self._running:
+            try:
+                batch = [self._queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._predict(batch)
+            self.batches += 1
+            self.requests += len(batch)
+
+    def start(self):
+        if self.family == socket.AF_UNIX:
+            if os.path.exists(self.address):
+                os.remove(self.address)
+            self._server = _UnixServer(self.address, self._make_handler())
+        else:
+            self._server = _TCPServer(self.address, self._make_handler())
+        self._running = True
+        for target, name in ((self._server.serve_forever, "inference-server"), (self._batch_loop, "inference-batcher")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"Inference server listening on {self._server.server_address}")
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        for thread in self._threads:
+            thread.join(timeout=2.0)
+        self._threads = []
+
+
+# Client ----------------------------------------------------------------------
+class RemoteRequest:
+    def __init__(self, request_id, deadline):
+        self.request_id = request_id
+        self.deadline = deadline
+        self.boxes = None
+        self._event = threading.Event()
+
+    def resolve(self, boxes):
+        self.boxes = boxes
+        self._event.set()
+
+    def wait(self):
+        """Boxes from the server, or None when it failed or answered after the deadline."""
+        if not self._event.wait(max(0.0, self.deadline - time.monotonic())):
+            return None
+        return self.boxes
+
+
+class RemoteInferenceClient:
+    """
+    Pipelined client. `submit` sends the image and returns immediately with
+    a RemoteRequest, or None when the server is unavailable or `max_in_flight`
+    requests are already waiting; one reader thread matches responses to
+    requests by id. After `max_failures` late or failed requests in a row the
+    connection is dropped and retried after `retry_interval` seconds, so a
+    slow server stops costing time on every frame.
+    """
+
+    def __init__(self, address, timeout=0.2, max_in_flight=4, jpeg_quality=80, max_failures=3, retry_interval=5.0):
+        self.address = address
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self.jpeg_quality = jpeg_quality
+        self.max_failures = max_failures
+        self.retry_interval = retry_interval
+        self.failures = 0
+        self._sock = None
+        self._next_request_id = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._retry_at = 0.0
+
+    def _connect(self):
+        family, address = parse_address(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        # Bounded by the request timeout, so an unreachable server never stalls the frame loop for long.
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(address)
+        except OSError:
+            sock.close()
+            raise
+        sock.settimeout(None)
+        if family == socket.AF_INET:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock = sock
+        threading.Thread(target=self._read_loop, args=(sock,), name="inference-client", daemon=True).start()
+        print(f"Connected to inference server {self.address}.")
+
+    def _disconnect(self, sock):
+        with self._lock:
+            if self._sock is not sock:
+                return
+            self._sock = None
+            self._retry_at = time.monotonic() + self.retry_interval
+            pending, self._pending = self._pending, {}
+        try:
+            sock.close()
+        except OSError:
+            pass
+        for request in pending.values():
+            request.resolve(None)
+
+    def _read_loop(self, sock):
+        try:
+            while True:
+                magic, request_id, status, count = RESPONSE_HEADER.unpack(recv_exact(sock, RESPONSE_HEADER.size))
+                if magic != RESPONSE_MAGIC:
+                    raise ConnectionError("Bad response from inference server.")
+                boxes = np.frombuffer(recv_exact(sock, count * 24), dtype=np.float32).reshape(-1, 6) if count else np.zeros((0, 6), dtype=np.float32)
+                with self._lock:
+                    request = self._pending.pop(request_id, None)
+                if request is not None:
+                    request.resolve(boxes if status == STATUS_OK else None)
+        except (ConnectionError, OSError, struct.error):
+            self._disconnect(sock)
+
+    def submit(self, image, confidence, imgsz):
+        with self._lock:
+            if self._sock is None and time.monotonic() < self._retry_at:
+                return None
+            if len(self._pending) >= self.max_in_flight:
+                return None
+        if self._sock is None:
+            try:
+                self._connect()
+            except OSError:
+                self._retry_at = time.monotonic() + self.retry_interval
+                return None
+
+        ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            return None
+        sock = self._sock
+        with self._lock:
+            self._next_request_id = (self._next_request_id + 1) & 0xFFFFFFFF
+            request = RemoteRequest(self._next_request_id, time.monotonic() + self.timeout)
+            self._pending[request.request_id] = request
+        try:
+            with self._send_lock:
+                sock.sendall(REQUEST_HEADER.pack(REQUEST_MAGIC, request.request_id, confidence, imgsz or 0, len(encoded)) + encoded.tobytes())
+        except (OSError, AttributeError):
+            self._disconnect(sock)
+            return None
+        return request
+
+    def result(self, request):
+        """Wait for a submitted request. Returns None when the caller has to run inference itself."""
+        boxes = request.wait() if request is not None else None
+        if request is not None:
+            with self._lock:
+                self._pending.pop(request.request_id, None)
+            self.failures = 0 if boxes is not None else self.failures + 1
+            if self.failures >= self.max_failures and self._sock is not None:
+                print(f"Inference server {self.address} is too slow, using on-device inference for {self.retry_interval:.0f} s.")
+                self.failures = 0
+                self._disconnect(self._sock)
+        return boxes
+
+    def close(self):
+        if self._sock is not None:
+            self._disconnect(self._sock)
+
+
+def create_remote_client(inference_server, timeout=0.2, max_in_flight=4, jpeg_quality=80):
+    if inference_server is None or str(inference_server).lower() in ("", "none"):
+        return None
+    return RemoteInferenceClient(inference_server, timeout, max_in_flight, jpeg_quality)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve YOLO inference to stls clients on the local network.")
+    parser.add_argument("--listen", default="tcp://0.0.0.0:9200", help="tcp://host:port or unix:///path")
+    parser.add_argument("--weights", default="src/YOLO11_training/train_result/weights/best.pt")
+    parser.add_argument("--backend", default="pytorch")
+    parser.add_argument("--quantize", default="none")
+    parser.add_argument("--input-size", type=int, default=640)
+    parser.add_argument("--detector", choices=["stub", "yolo"], default="yolo")
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--batch-wait", type=float, default=0.005, help="Seconds to wait for more requests to batch.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from stls_lib import stls
+
+    args = parse_args(argv)
+    if args.detector == "stub":
+        from stls_lib.benchmark import StubDetector
+        model = StubDetector()
+    else:
+        model = stls.load_model(args.weights, args.backend, args.input_size, args.quantize, warmup=True)
+    server = InferenceServer(model, args.listen, args.max_batch, args.batch_wait).start()
+    try:
+        while True:
+            time.sleep(10.0)
+            if server.batches:
+                print(f"requests: {server.requests}  batches: {server.batches}  mean batch: {server.requests / server.batches:.2f}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
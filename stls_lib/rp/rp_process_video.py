@@ -1,39 +1,193 @@
 import cv2
+import numpy as np
+import signal
 import time
-from picamera2 import Picamera2
 from stls_lib import stls
-import RPi.GPIO as GPIO
+from stls_lib.config_watcher import ConfigWatcher
+from stls_lib.frame_source import create_frame_source, get_capture_mode
+from stls_lib.metrics import MetricsServer, registry as metrics
+from stls_lib.pipeline import Pipeline, Stage, StopPipeline
+from stls_lib.queuing import ZoneQueuing, parse_zone_relays
+from stls_lib.recorder import EventRecorder
+from stls_lib.scheduler import create_scheduler
+from stls_lib.latency_controller import create_latency_controller
+from stls_lib.detector import Detections, Detector
+from stls_lib.overlay import OverlayRenderer
+from stls_lib.startup import run_startup_tasks
+from stls_lib.zone_cache import load_zones
+from stls_lib.tracker import ZONE_ENTRY_COLUMN, IoUTracker
+from stls_lib.relay import RelayActuator, create_relay_backend
+from stls_lib.remote_inference import create_remote_client
 
 # Define relay pin numbers
 RELAY_ZONE_0_CAR = 17
 RELAY_ZONE_0_MOTORBIKE = 27
 RELAY_ZONE_0_OTHER = 22
 
-# Setup GPIO mode and initialize relays
-# Setup GPIO mode and initialize relays
-GPIO.setmode(GPIO.BCM)
-GPIO.setup([RELAY_ZONE_0_CAR, RELAY_ZONE_0_MOTORBIKE, RELAY_ZONE_0_OTHER], GPIO.OUT, initial=GPIO.HIGH)
-
-    # Default: Turn all relays OFF
-GPIO.output(RELAY_ZONE_0_CAR, GPIO.HIGH)
-GPIO.output(RELAY_ZONE_0_MOTORBIKE, GPIO.HIGH)
-GPIO.output(RELAY_ZONE_0_OTHER, GPIO.LOW)
-
-def activate_relay(vehicle_type):
-    print(vehicle_type)
-    
-    if vehicle_type == "car":
-        GPIO.output(RELAY_ZONE_0_CAR, GPIO.LOW)
-        GPIO.output(RELAY_ZONE_0_MOTORBIKE, GPIO.HIGH)
-        GPIO.output(RELAY_ZONE_0_OTHER, GPIO.HIGH)
-    elif vehicle_type == "motorbike":
-        GPIO.output(RELAY_ZONE_0_CAR, GPIO.HIGH)
-        GPIO.output(RELAY_ZONE_0_MOTORBIKE, GPIO.LOW)
-        GPIO.output(RELAY_ZONE_0_OTHER, GPIO.HIGH)
-    elif vehicle_type == "none":
-        GPIO.output(RELAY_ZONE_0_CAR, GPIO.HIGH)
-        GPIO.output(RELAY_ZONE_0_MOTORBIKE, GPIO.HIGH)
-        GPIO.output(RELAY_ZONE_0_OTHER, GPIO.LOW)
+ZONE_0_RELAY_PINS = (RELAY_ZONE_0_CAR, RELAY_ZONE_0_MOTORBIKE, RELAY_ZONE_0_OTHER)
+
+def on_relay_switch(vehicle_type, relay_name, recorder=None):
+    # Runs on the relay worker thread, never on the frame loop.
+    print(f"{relay_name}: {vehicle_type}")
+    metrics.inc("relay_switches_total", labels={"relay": relay_name})
+    if recorder is not None:
+        recorder.trigger(f"{relay_name}: {vehicle_type}")
+
+def create_zone_relays(relay_driver, zone_relays, number_of_zones, relay_debounce, relay_min_dwell, name_prefix="", recorder=None):
+    """One RelayActuator per zone listed in the zone -> relay pins mapping."""
+    relays = {}
+    for zone_indx, relay_pins in zone_relays.items():
+        if zone_indx >= number_of_zones:
+            raise ValueError(f"zone_relays maps zone {zone_indx}, but only {number_of_zones} zones are configured.")
+        relay_name = f"{name_prefix}zone {zone_indx}"
+        relays[zone_indx] = RelayActuator(relay_driver, relay_pins, relay_debounce, relay_min_dwell,
+                                          on_switch=lambda vehicle_type, name=relay_name: on_relay_switch(vehicle_type, name, recorder))
+    return relays
+
+def request_zone_relays(relays, zones_status, changed):
+    for zone_indx in np.flatnonzero(changed):
+        relay = relays.get(int(zone_indx))
+        if relay is not None:
+            relay.request(zones_status[zone_indx]["vehicle"])
+
+def get_source_zone_relays(config):
+    """zone_relays maps any zone to relays; the relay_car/motorbike/other keys of a source are shorthand for zone 0."""
+    zone_relays = parse_zone_relays(config.get("zone_relays"))
+    relay_pins = (config.get("relay_car"), config.get("relay_motorbike"), config.get("relay_other"))
+    if None not in relay_pins:
+        zone_relays.setdefault(0, relay_pins)
+    return zone_relays
+
+def build_zone_settings(compiled_zones, frame_width, frame_height, roi_margin, inference_scheduler, inference_stride, motion_threshold, min_refresh_interval):
+    """Everything the frame loop derives from one zones file; replaced as a whole when the file is reloaded."""
+    zones = compiled_zones["zones"]
+    return {
+        "zones": zones,
+        "zone_centroids": compiled_zones["centroids"],
+        "zone_mask": compiled_zones["zone_mask"],
+        "number_of_zones": compiled_zones["number_of_zones"],
+        "roi": stls.get_zones_roi(zones, frame_width, frame_height, roi_margin),
+        "scheduler": create_scheduler(inference_scheduler, compiled_zones["zone_mask"], inference_stride, motion_threshold, min_refresh_interval),
+    }
+
+def validate_zone_settings(zone_settings, relays, zones_file_path):
+    zones = zone_settings["zones"]
+    if zone_settings["number_of_zones"] != len(zones):
+        raise ValueError(f"'{zones_file_path}' lists {len(zones)} zones but number_of_zone is {zone_settings['number_of_zones']}.")
+    for zone_id, zone in zones.items():
+        if len(zone) < 3:
+            raise ValueError(f"Zone {zone_id} in '{zones_file_path}' has fewer than 3 points.")
+    for zone_indx in relays:
+        if zone_indx >= len(zones):
+            raise ValueError(f"zone_relays maps zone {zone_indx}, but '{zones_file_path}' only has {len(zones)} zones.")
+
+def load_root_settings(root_data_path, detect_sensitivity, time_interval):
+    """detect_sensitivity and time_interval from root_data.txt, falling back to the running values."""
+    root_data = stls.extract_root_data(root_data_path) if root_data_path else {}
+    detect_sensitivity = float(root_data.get("detect_sensitivity", detect_sensitivity))
+    time_interval = float(root_data.get("time_interval", time_interval))
+    if not 0.0 < detect_sensitivity <= 1.0:
+        raise ValueError(f"detect_sensitivity must be in (0, 1]. Found: {detect_sensitivity}")
+    if time_interval <= 0.0:
+        raise ValueError(f"time_interval must be positive. Found: {time_interval}")
+    return {"detect_sensitivity": detect_sensitivity, "time_interval": time_interval}
+
+def get_frame_pool_size(buffer_size, queue_size):
+    # Frames alive at once: the source ring buffer, the two bounded stage queues, the render queue and one per stage.
+    return buffer_size + 2 * queue_size + 1 + 4 + 1
+
+def unpack_frame(frame, frame_width, frame_height):
+    """
+    Split a captured frame into (inference image, display frame, box scale).
+    Dual-stream captures already carry an image at the model input size and
+    boxes predicted on it are scaled by `box scale` to frame coordinates;
+    single frames are only resized when they are not at the frame size.
+    """
+    if isinstance(frame, tuple):
+        image, display_frame = frame
+        return image, display_frame, (frame_width / image.shape[1], frame_height / image.shape[0])
+    if frame.shape[1] != frame_width or frame.shape[0] != frame_height:
+        frame = cv2.resize(frame, (frame_width, frame_height))
+    return frame, frame, None
+
+def predict_boxes(image, detector, detect_sensitivity, roi, box_scale, model_input_size, predict_imgsz):
+    """Detections in frame coordinates for one image returned by unpack_frame, on the ROI when `roi` is set."""
+    if roi is None:
+        return detector.detect(image, detect_sensitivity, imgsz=predict_imgsz).to_frame(box_scale=box_scale)
+    if box_scale is not None:
+        roi = stls.scale_roi(roi, 1 / box_scale[0], 1 / box_scale[1])
+    crop, transform = stls.letterbox_roi(image, roi, model_input_size)
+    return detector.detect(crop, detect_sensitivity, imgsz=model_input_size).to_frame(transform, box_scale)
+
+def submit_remote(remote, image, detect_sensitivity, roi, box_scale, model_input_size):
+    """
+    Send the letterboxed ROI, or the whole image, at the model input size to
+    the inference server. Returns (request, transform); request is None when
+    the server cannot take it.
+    """
+    if roi is None:
+        roi = (0, 0, image.shape[1], image.shape[0])
+    elif box_scale is not None:
+        roi = stls.scale_roi(roi, 1 / box_scale[0], 1 / box_scale[1])
+    crop, transform = stls.letterbox_roi(image, roi, model_input_size)
+    return remote.submit(crop, detect_sensitivity, model_input_size), transform
+
+def resolve_remote(remote, request, transform, box_scale):
+    """Boxes in frame coordinates from the server, or None when they have to be computed on the device."""
+    boxes = remote.result(request)
+    if boxes is None:
+        return None
+    return Detections(boxes).to_frame(transform, box_scale)
+
+def start_config_watcher(config_reload, paths, load, config_poll_interval):
+    if not config_reload:
+        return None
+    return ConfigWatcher(paths, load, interval=config_poll_interval).start()
+
+def start_recorder(record_events, record_dir, frame_width, frame_height, record_pre_seconds, record_post_seconds, record_fps, record_width, record_max_mb, name="recorder"):
+    if not record_events:
+        return None
+    return EventRecorder(record_dir, frame_width, frame_height, record_pre_seconds, record_post_seconds, record_fps, record_width,
+                         clips_max_bytes=int(float(record_max_mb) * (1 << 20)), name=name).start()
+
+def install_record_signal(recorders):
+    """`kill -USR1 <pid>` saves a clip on every recorder."""
+    recorders = [recorder for recorder in recorders if recorder is not None]
+    if not recorders or not hasattr(signal, "SIGUSR1"):
+        return
+    try:
+        signal.signal(signal.SIGUSR1, lambda signum, frame: [recorder.trigger("signal") for recorder in recorders])
+    except ValueError:
+        pass  # Not on the main thread; relay switches and anomalies still trigger clips.
+
+def record_frame(recorder, packet, frame, detections, zones_status, vehicle, vehicle_count, changed, record_anomaly_latency):
+    if recorder is None:
+        return
+    recorder.record(packet["capture_time"], frame, detections, zones_status, vehicle, vehicle_count, changed)
+    latency = time.time() - packet["capture_time"]
+    if record_anomaly_latency and latency > record_anomaly_latency:
+        recorder.trigger(f"decision latency {latency * 1000:.0f} ms")
+
+def on_operating_point(point, p90=None):
+    metrics.set_gauge("latency_level", point["level"])
+    metrics.set_gauge("latency_input_size", point["input_size"])
+    metrics.set_gauge("latency_stride", point["stride"])
+    metrics.set_gauge("latency_draw", int(point["draw"]))
+    if p90 is not None:
+        print(f"Decision latency p90 {p90 * 1000:.0f} ms: input size {point['input_size']}, stride {point['stride']}, overlays {'on' if point['draw'] else 'off'}.")
+
+def start_metrics(metrics_port, metrics_json_path, metrics_interval):
+    if not metrics_port and str(metrics_json_path).lower() == "none":
+        return None
+    json_path = None if str(metrics_json_path).lower() == "none" else metrics_json_path
+    return MetricsServer(metrics, port=metrics_port, json_path=json_path, interval=metrics_interval).start()
+
+def update_drop_metrics(frame_sources, pipeline):
+    # Called from the capture stage, so the totals keep moving when nothing is rendered.
+    metrics.set_counter("frames_captured_total", sum(source.frames_captured for source in frame_sources))
+    metrics.set_counter("frames_dropped_total", sum(source.frames_dropped for source in frame_sources), {"where": "capture"})
+    for stage_name, stats in pipeline.stats().items():
+        metrics.set_counter("frames_dropped_total", stats["dropped"], {"where": stage_name})
 
 def main(weight_file_path: str,
          class_list_file_path: str,
@@ -45,64 +199,516 @@ def main(weight_file_path: str,
          frame_width: int,
          wait_key: int,
          ord_key: str,
+         frame_source: str = "picamera",
+         video_source: str = None,
+         queue_policy: str = "drop",
+         queue_size: int = 2,
+         inference_mode: str = "full",
+         roi_margin: int = 32,
+         model_input_size: int = 640,
+         inference_scheduler: str = "fixed",
+         inference_stride: int = 3,
+         motion_threshold: float = 0.002,
+         min_refresh_interval: float = 1.0,
+         use_tracker: bool = False,
+         model_backend: str = "pytorch",
+         model_quantize: str = "none",
+         metrics_port: int = 0,
+         metrics_json_path: str = "none",
+         metrics_interval: float = 10.0,
+         relay_backend: str = "rpi",
+         relay_debounce: float = 0.2,
+         relay_min_dwell: float = 1.0,
+         config_reload: bool = False,
+         config_poll_interval: float = 1.0,
+         root_data_path: str = None,
+         capture_mode: str = "main",
+         record_events: bool = False,
+         record_dir: str = "recordings",
+         record_pre_seconds: float = 5.0,
+         record_post_seconds: float = 5.0,
+         record_fps: float = 5.0,
+         record_width: int = 480,
+         record_max_mb: float = 1024.0,
+         record_anomaly_latency: float = 0.0,
+         inference_server: str = "none",
+         inference_timeout: float = 0.2,
+         inference_max_in_flight: int = 4,
+         inference_jpeg_quality: int = 80,
+         latency_target: float = 0.0,
+         latency_input_sizes: str = "640,480,320",
+         latency_strides: str = "1,2,3",
+         zone_relays: str = None,
          ):
 
-    # Initialize camera
-    picam2 = Picamera2()
-    picam2.preview_configuration.main.size = (frame_width, frame_height)
-    picam2.preview_configuration.main.format = "RGB888"
-    picam2.preview_configuration.align()
-    picam2.configure("preview")
-    picam2.start()
+    metrics_server = start_metrics(metrics_port, metrics_json_path, metrics_interval)
+
+    # Initialize camera. Frames are captured on a background thread; the loop only ever sees the newest one.
+    # With capture_mode "lores" the camera delivers the inference image itself and the full frame only when it is shown.
+    # Other sources than the Pi camera fall back to "main".
+    capture_mode = get_capture_mode(frame_source, capture_mode)
+    source = create_frame_source(frame_source, frame_width, frame_height, video_source=video_source, capture_mode=capture_mode,
+                                 inference_size=model_input_size, keep_main=frame_name.lower() != "off", pool_size=get_frame_pool_size(2, queue_size))
 
-    
     # Load YOLO model and configurations
-    yolo_model = stls.load_model(weight_file_path)
-    class_list = stls.load_class_names(class_list_file_path)
-    
-        # Extract data from the zones.txt file
-    data = stls.extract_data_from_file(zones_file_path)
-    zones = stls.convert_coordinates(data["zones"], data["frame_width"], data["frame_height"], frame_width, frame_height) # Ensuring the zone coordinates to fit the new frame dimensions
-    number_of_zones = data["number_of_zones"]
-
-    # Initialize zones and tracking data
-    count = 0
-    success = True
-    zones_data = {"countdown_start_time": 0.0, "refresh": False, "get_vehicle": 'none'}
-    prev_vehic_zone = 'none'
-
-    while success:
-        start_time = time.time() * 1000
+    def load_model_task():
+        yolo_model = stls.load_model(weight_file_path, model_backend, model_input_size, model_quantize, warmup=True)
+        return yolo_model, stls.load_class_names(class_list_file_path)
+
+    # Camera, model and zones do not depend on each other, so they start concurrently.
+    try:
+        startup = run_startup_tasks({"camera": source.start, "model": load_model_task, "zones": lambda: load_zones(zones_file_path, frame_width, frame_height)}, metrics)
+    except Exception:
+        source.stop()
+        raise
+    yolo_model, class_list = startup["model"]
+    # Only vehicle classes survive NMS, and the predictor is reused without logging a line per frame.
+    detector = Detector(yolo_model, stls.get_vehicle_class_ids(class_list))
+    renderer = OverlayRenderer(frame_name, class_list)
+    # Exported models have a fixed input shape and lores images are already at the input size, so both ask for that size.
+    predict_imgsz = None if model_backend == "pytorch" and capture_mode != "lores" else model_input_size
+    use_roi = inference_mode.lower() == "roi"
+    scheduler_options = (inference_scheduler, inference_stride, motion_threshold, min_refresh_interval)
+    # Settings that can be hot reloaded. Zones are scaled to the frame size with their label mask, read from the compiled zone cache.
+    live = dict(build_zone_settings(startup["zones"], frame_width, frame_height, roi_margin, *scheduler_options),
+                detect_sensitivity=detect_sensitivity, time_interval=time_interval)
+    # With the tracker on, skipped frames still flow through the pipeline and reuse the predicted tracks.
+    tracker = IoUTracker() if use_tracker else None
+
+    # Initialize zones and tracking data. Every zone is queued; zones listed in zone_relays drive their own relays.
+    queuing = ZoneQueuing(live["number_of_zones"], time_interval)
+    relay_driver = create_relay_backend(relay_backend)
+    # Relay switches, slow decisions and SIGUSR1 save a clip of the seconds around them.
+    recorder = start_recorder(record_events, record_dir, frame_width, frame_height, record_pre_seconds, record_post_seconds, record_fps, record_width, record_max_mb)
+    install_record_signal([recorder])
+    # Without a zone_relays setting zone 0 drives the default pins, as long as the zones file lists a zone.
+    zone_relays = parse_zone_relays(zone_relays)
+    if not zone_relays and live["number_of_zones"] > 0:
+        zone_relays = {0: ZONE_0_RELAY_PINS}
+    relays = create_zone_relays(relay_driver, zone_relays, live["number_of_zones"], relay_debounce, relay_min_dwell, recorder=recorder)
+
+    # Frames go to the inference server when one is configured; late or failed requests are predicted on the device.
+    remote = create_remote_client(inference_server, inference_timeout, inference_max_in_flight, inference_jpeg_quality)
+
+    # Reloads are built and validated on the watcher thread; the capture stage swaps them in between frames.
+    def load_live_settings():
+        settings = load_root_settings(root_data_path, live["detect_sensitivity"], live["time_interval"])
+        zone_settings = build_zone_settings(load_zones(zones_file_path, frame_width, frame_height), frame_width, frame_height, roi_margin, *scheduler_options)
+        validate_zone_settings(zone_settings, relays, zones_file_path)
+        return dict(zone_settings, **settings)
+
+    watcher = start_config_watcher(config_reload, [root_data_path, zones_file_path], load_live_settings, config_poll_interval)
+
+    # With a latency target, the decision latency picks the input size, the inference stride and whether overlays are drawn.
+    # Exported models have a fixed input shape, so only the stride and overlays change for them.
+    # The controller starts at the configured input size and the stride the scheduler actually runs at (1 for the motion scheduler).
+    controller = create_latency_controller(latency_target, latency_input_sizes if model_backend == "pytorch" else model_input_size,
+                                           latency_strides, on_change=on_operating_point, input_size=model_input_size, stride=live["scheduler"].stride)
+    if controller is not None:
+        on_operating_point(controller.operating_point)
+    # (scheduler, level) the controller's stride was last written for.
+    applied_point = None
+
+    # Each stage runs on its own thread and hands a packet dict to the next one.
+    # Every packet carries the settings it was captured with, so a reload never changes them halfway through a frame.
+    def capture_stage():
+        nonlocal live, applied_point
+        if watcher is not None:
+            reloaded = watcher.poll()
+            if reloaded is not None:
+                live = reloaded
+                metrics.inc("config_reloads_total")
+
+        captured = source.read()
+        update_drop_metrics([source], pipeline)
+        if captured is None:
+            if source.finished:
+                raise StopPipeline()
+            return None
+
+        _, capture_time, frame = captured
+        point = {"input_size": model_input_size, "predict_imgsz": predict_imgsz, "draw": True}
+        if controller is not None:
+            point = controller.operating_point
+            point["predict_imgsz"] = point["input_size"]
+            # The scheduler keeps its own stride until the controller moves; after that a reloaded scheduler gets the current one.
+            if controller.changes and (live["scheduler"], point["level"]) != applied_point:
+                live["scheduler"].stride = point["stride"]
+                applied_point = (live["scheduler"], point["level"])
+        with metrics.time_stage("schedule"):
+            # Dual-stream frames are gated on the small inference image.
+            infer = live["scheduler"].should_infer(frame[0] if isinstance(frame, tuple) else frame, capture_time)
+        if not infer:
+            metrics.inc("frames_skipped_total")
+            if tracker is None:
+                return None
+
+        return {"frame": frame, "capture_time": capture_time, "infer": infer, "start_time": time.time() * 1000, "live": live,
+                "input_size": point["input_size"], "predict_imgsz": point["predict_imgsz"], "draw": point["draw"]}
+
+    def inference_stage(packet):
+        with metrics.time_stage("resize"):
+            packet["image"], packet["frame"], packet["box_scale"] = unpack_frame(packet["frame"], frame_width, frame_height)
+        packet["boxes"] = None
+        packet["remote_request"] = None
+        if not packet["infer"]:
+            return packet
+
+        settings = packet["live"]
+        roi = settings["roi"] if use_roi else None
+        if remote is not None:
+            # The request stays in flight while the next frames are captured; the decision stage collects it.
+            with metrics.time_stage("remote_submit"):
+                packet["remote_request"], packet["remote_transform"] = submit_remote(remote, packet["image"], settings["detect_sensitivity"], roi, packet["box_scale"], packet["input_size"])
+            if packet["remote_request"] is not None:
+                metrics.inc("remote_requests_total")
+                return packet
+
+        with metrics.time_stage("predict"):
+            packet["boxes"] = predict_boxes(packet["image"], detector, settings["detect_sensitivity"], roi, packet["box_scale"], packet["input_size"], packet["predict_imgsz"])
+        metrics.inc("inferences_total")
+        return packet
+
+    def decision_stage(packet):
+        nonlocal queuing
+        settings = packet["live"]
+        number_of_zones = settings["number_of_zones"]
+        if queuing.number_of_zones != number_of_zones:
+            queuing = ZoneQueuing(number_of_zones, settings["time_interval"])
+        queuing.interval = settings["time_interval"]
+
+        if packet["remote_request"] is not None:
+            with metrics.time_stage("remote_wait"):
+                packet["boxes"] = resolve_remote(remote, packet["remote_request"], packet["remote_transform"], packet["box_scale"])
+            if packet["boxes"] is None:
+                # The device fallback runs after the server timed out, so its latency includes inference_timeout.
+                # Detector serialises it with the inference stage, which may be predicting the next frame.
+                metrics.inc("remote_fallbacks_total")
+                with metrics.time_stage("predict"):
+                    roi = settings["roi"] if use_roi else None
+                    packet["boxes"] = predict_boxes(packet["image"], detector, settings["detect_sensitivity"], roi, packet["box_scale"], packet["input_size"], packet["predict_imgsz"])
+                metrics.inc("inferences_total")
+
+        with metrics.time_stage("zone_test"):
+            boxes, entry_times = packet["boxes"], None
+            if tracker is not None:
+                # Tracks carry the time they entered each zone, so each zone's queue is in FIFO order.
+                zone_args = (settings["zone_mask"], number_of_zones)
+                boxes = tracker.update(boxes, packet["capture_time"], *zone_args) if packet["infer"] else tracker.predict(packet["capture_time"], *zone_args)
+                entry_times = boxes[:, ZONE_ENTRY_COLUMN:]
+
+            first_vehicle, vehicle_count, detections = stls.find_zone_vehicles(boxes, class_list, settings["zone_mask"], number_of_zones, entry_times)
+
+        with metrics.time_stage("queuing"):
+            vehicle, elapsed, changed = queuing.update(first_vehicle, vehicle_count, time.time())
+            zones_status = queuing.status(class_list, elapsed)
+            request_zone_relays(relays, zones_status, changed)
+        record_frame(recorder, packet, packet["image"], detections, zones_status, vehicle, vehicle_count, changed, record_anomaly_latency)
+
+        packet["detections"] = detections
+        packet["is_zone_occupied"] = bool(vehicle_count[0] > 0) if number_of_zones else False
+        packet["hanlde_current_vehic"] = zones_status
+        packet["processing_time"] = (time.time() * 1000) - packet["start_time"]
+        latency = time.time() - packet["capture_time"]
+        metrics.observe("decision_latency_seconds", latency)
+        if controller is not None:
+            controller.observe(latency)
+        metrics.inc("frames_processed_total")
+        return packet
+
+    def render_stage(packet):
+        if frame_name.lower() == "off":
+            return
+
+        frame = packet["frame"]
+        # Over the latency budget the frame is shown without overlays.
+        if packet["draw"]:
+            with metrics.time_stage("draw"):
+                settings = packet["live"]
+                renderer.draw(frame, settings["zones"], settings["zone_centroids"], packet["detections"], packet["hanlde_current_vehic"],
+                              packet["processing_time"], packet["is_zone_occupied"])  # Optional visualization
+        with metrics.time_stage("display"):
+            if not stls.show_frame(frame, frame_name, wait_key, ord_key):  # Optional frame display
+                raise StopPipeline()
+
+    # The render queue always drops so that the relay decision never waits on drawing or cv2.imshow.
+    pipeline = Pipeline([
+        Stage("capture", capture_stage),
+        Stage("inference", inference_stage, queue_size=queue_size, policy=queue_policy),
+        Stage("decision", decision_stage, queue_size=queue_size, policy=queue_policy),
+        Stage("render", render_stage, queue_size=1, policy="drop"),
+    ])
+
+    try:
+        pipeline.run()
+    finally:
+        if watcher is not None:
+            watcher.stop()
+        source.stop()
+        for relay in relays.values():
+            relay.stop()
+        if recorder is not None:
+            recorder.stop()
+        if remote is not None:
+            remote.close()
+        relay_driver.close()
+        if metrics_server is not None:
+            metrics_server.stop()
+        cv2.destroyAllWindows()
+
+
+def main_multi_source(weight_file_path: str,
+                      class_list_file_path: str,
+                      sources_file_path: str,
+                      detect_sensitivity: float,
+                      time_interval: float,
+                      frame_name: str,
+                      frame_height: int,
+                      frame_width: int,
+                      wait_key: int,
+                      ord_key: str,
+                      queue_policy: str = "drop",
+                      queue_size: int = 2,
+                      inference_mode: str = "full",
+                      roi_margin: int = 32,
+                      model_input_size: int = 640,
+                      inference_scheduler: str = "fixed",
+                      inference_stride: int = 3,
+                      motion_threshold: float = 0.002,
+                      min_refresh_interval: float = 1.0,
+                      use_tracker: bool = False,
+                      model_backend: str = "pytorch",
+                      model_quantize: str = "none",
+                      metrics_port: int = 0,
+                      metrics_json_path: str = "none",
+                      metrics_interval: float = 10.0,
+                      relay_backend: str = "rpi",
+                      relay_debounce: float = 0.2,
+                      relay_min_dwell: float = 1.0,
+                      config_reload: bool = False,
+                      config_poll_interval: float = 1.0,
+                      root_data_path: str = None,
+                      capture_mode: str = "main",
+                      record_events: bool = False,
+                      record_dir: str = "recordings",
+                      record_pre_seconds: float = 5.0,
+                      record_post_seconds: float = 5.0,
+                      record_fps: float = 5.0,
+                      record_width: int = 480,
+                      record_max_mb: float = 1024.0,
+                      record_anomaly_latency: float = 0.0,
+                      ):
+    """
+    Run several approaches of one intersection from one process. The newest
+    frame of every source is collected into a single batched predict call and
+    the results are split back to each source's zones and queuing state.
+    """
+    metrics_server = start_metrics(metrics_port, metrics_json_path, metrics_interval)
+
+    relay_driver = create_relay_backend(relay_backend)
+
+    scheduler_options = (inference_scheduler, inference_stride, motion_threshold, min_refresh_interval)
+    sources = []
+    zone_settings = []
+    for config in stls.extract_sources_from_file(sources_file_path):
+        source_capture_mode = get_capture_mode(config.get("frame_source", "picamera"), config.get("capture_mode", capture_mode))
+        source = create_frame_source(config.get("frame_source", "picamera"), frame_width, frame_height, video_source=config.get("video_source"),
+                                     capture_mode=source_capture_mode, inference_size=model_input_size,
+                                     keep_main=frame_name.lower() != "off", pool_size=get_frame_pool_size(2, queue_size))
+        zone_settings.append(build_zone_settings(load_zones(config["zones_file_path"], frame_width, frame_height), frame_width, frame_height, roi_margin, *scheduler_options))
+        number_of_zones = zone_settings[-1]["number_of_zones"]
+        zone_relays = get_source_zone_relays(config)
+        recorder = start_recorder(record_events, record_dir, frame_width, frame_height, record_pre_seconds, record_post_seconds, record_fps, record_width, record_max_mb, name=config["name"])
+        sources.append({
+            "name": config["name"],
+            "frame_source": source,
+            # Exported models have a fixed input shape and lores images are already at the input size, so both ask for that size.
+            "predict_imgsz": None if model_backend == "pytorch" and source_capture_mode != "lores" else model_input_size,
+            "zones_file_path": config["zones_file_path"],
+            "tracker": IoUTracker() if use_tracker else None,
+            "queuing": ZoneQueuing(number_of_zones, time_interval),
+            "recorder": recorder,
+            "relays": create_zone_relays(relay_driver, zone_relays, number_of_zones, relay_debounce, relay_min_dwell, f"{config['name']} ", recorder),
+            "window_name": frame_name if frame_name.lower() == "off" else f"{frame_name} - {config['name']}",
+        })
+
+    if not sources:
+        raise ValueError(f"No sources found in '{sources_file_path}'.")
+    install_record_signal([source["recorder"] for source in sources])
+
+    # Settings that can be hot reloaded; "sources" holds the zone settings of every source in order.
+    live = {"detect_sensitivity": detect_sensitivity, "time_interval": time_interval, "sources": zone_settings}
+
+    def load_model_task():
+        yolo_model = stls.load_model(weight_file_path, model_backend, model_input_size, model_quantize, warmup=True)
+        return yolo_model, stls.load_class_names(class_list_file_path)
+
+    # Every camera and the model start concurrently.
+    startup_tasks = {f"camera {source['name']}": source["frame_source"].start for source in sources}
+    startup_tasks["model"] = load_model_task
+    try:
+        startup = run_startup_tasks(startup_tasks, metrics)
+    except Exception:
+        for source in sources:
+            source["frame_source"].stop()
+        raise
+    yolo_model, class_list = startup["model"]
+    detector = Detector(yolo_model, stls.get_vehicle_class_ids(class_list))
+    renderers = [OverlayRenderer(source["window_name"], class_list) for source in sources]
+
+    # The list of sources is fixed at startup; root_data.txt and every source's zones file can be reloaded.
+    def load_live_settings():
+        settings = load_root_settings(root_data_path, live["detect_sensitivity"], live["time_interval"])
+        settings["sources"] = []
+        for source in sources:
+            compiled_zones = load_zones(source["zones_file_path"], frame_width, frame_height)
+            source_settings = build_zone_settings(compiled_zones, frame_width, frame_height, roi_margin, *scheduler_options)
+            validate_zone_settings(source_settings, source["relays"], source["zones_file_path"])
+            settings["sources"].append(source_settings)
+        return settings
+
+    watch_paths = [root_data_path] + [source["zones_file_path"] for source in sources]
+    watcher = start_config_watcher(config_reload, watch_paths, load_live_settings, config_poll_interval)
+
+    def capture_stage():
+        nonlocal live
+        if watcher is not None:
+            reloaded = watcher.poll()
+            if reloaded is not None:
+                live = reloaded
+                metrics.inc("config_reloads_total")
+
+        # Take whatever is newest on every source; all sources share one short wait so slower cameras still make the batch.
+        batch = []
+        received = False
+        deadline = time.monotonic() + 0.05
+        for index, source in enumerate(sources):
+            captured = source["frame_source"].read(timeout=max(0.0, deadline - time.monotonic()))
+            if captured is None:
+                continue
+            received = True
+            # Only sources whose scheduler asks for inference join the predict batch.
+            with metrics.time_stage("schedule"):
+                frame = captured[2]
+                infer = live["sources"][index]["scheduler"].should_infer(frame[0] if isinstance(frame, tuple) else frame, captured[1])
+            if not infer:
+                metrics.inc("frames_skipped_total", labels={"source": source["name"]})
+            if infer or source["tracker"] is not None:
+                batch.append((index, captured[1], captured[2], infer))
+        update_drop_metrics([source["frame_source"] for source in sources], pipeline)
+
+        if not received and all(source["frame_source"].finished for source in sources):
+            raise StopPipeline()
+        if not batch:
+            return None
+        return {"batch": batch, "start_time": time.time() * 1000, "live": live}
+
+    def inference_stage(packet):
+        settings = packet["live"]
+        with metrics.time_stage("resize"):
+            unpacked = [unpack_frame(frame, frame_width, frame_height) for _, _, frame, _ in packet["batch"]]
+        images = [image for image, _, _ in unpacked]
+        frames = [display_frame for _, display_frame, _ in unpacked]
+        to_infer = [i for i, (_, _, _, infer) in enumerate(packet["batch"]) if infer]
+        with metrics.time_stage("predict"):
+            if inference_mode.lower() == "roi":
+                # Every crop is letterboxed to the same square size, so they still go out as one batch.
+                crops = []
+                for i in to_infer:
+                    roi, box_scale = settings["sources"][packet["batch"][i][0]]["roi"], unpacked[i][2]
+                    if box_scale is not None:
+                        roi = stls.scale_roi(roi, 1 / box_scale[0], 1 / box_scale[1])
+                    crops.append(stls.letterbox_roi(images[i], roi, model_input_size))
+                boxes_per_frame = detector.detect_batch([image for image, _ in crops], settings["detect_sensitivity"], imgsz=model_input_size)
+                transforms = [transform for _, transform in crops]
+            else:
+                # One predict call per input size, so lores and full frames of mixed sources are each sized as their source asks.
+                by_imgsz = {}
+                for i in to_infer:
+                    by_imgsz.setdefault(sources[packet["batch"][i][0]]["predict_imgsz"], []).append(i)
+                found = {}
+                for imgsz, positions in by_imgsz.items():
+                    found.update(zip(positions, detector.detect_batch([images[i] for i in positions], settings["detect_sensitivity"], imgsz=imgsz)))
+                boxes_per_frame = [found[i] for i in to_infer]
+                transforms = [None] * len(to_infer)
+            # Boxes found on lores images are scaled up to frame coordinates by their own source's scale.
+            boxes_per_frame = [boxes.to_frame(transform, unpacked[i][2]) for i, boxes, transform in zip(to_infer, boxes_per_frame, transforms)]
+        metrics.inc("inferences_total", len(to_infer))
+
+        boxes_by_position = dict(zip(to_infer, boxes_per_frame))
+        packet["results"] = [
+            {"index": index, "capture_time": capture_time, "infer": infer, "frame": frames[i], "image": images[i], "boxes": boxes_by_position.get(i)}
+            for i, (index, capture_time, _, infer) in enumerate(packet["batch"])
+        ]
+        return packet
+
+    def decision_stage(packet):
         curr_time = time.time()
-        frame = picam2.capture_array()
+        for result in packet["results"]:
+            source = sources[result["index"]]
+            source_settings = packet["live"]["sources"][result["index"]]
+            number_of_zones = source_settings["number_of_zones"]
+            if source["queuing"].number_of_zones != number_of_zones:
+                source["queuing"] = ZoneQueuing(number_of_zones, packet["live"]["time_interval"])
+            source["queuing"].interval = packet["live"]["time_interval"]
+            boxes, entry_times = result["boxes"], None
+            if source["tracker"] is not None:
+                tracker = source["tracker"]
+                zone_args = (source_settings["zone_mask"], number_of_zones)
+                boxes = tracker.update(boxes, result["capture_time"], *zone_args) if result["infer"] else tracker.predict(result["capture_time"], *zone_args)
+                entry_times = boxes[:, ZONE_ENTRY_COLUMN:]
 
-        count += 1
-        if count % 3 != 0:
-            continue
+            with metrics.time_stage("zone_test"):
+                first_vehicle, vehicle_count, detections = stls.find_zone_vehicles(boxes, class_list, source_settings["zone_mask"], number_of_zones, entry_times)
 
-        collected_vehicle = stls.init_list_of_collected_vehicle(number_of_zones)
-        frame = cv2.resize(frame, (frame_width, frame_height))
-        boxes = stls.get_prediction_boxes(frame, yolo_model, detect_sensitivity)
-        stls.draw_polylines_zones(frame, zones, frame_name)  # Optional visualization
-        collected_vehicle = stls.track_objects_in_zones(frame, boxes, class_list, zones, collected_vehicle, frame_name)
-
-        hanlde_current_vehic = stls.handle_zone_queuing(collected_vehicle, curr_time, zones_data, time_interval)
-        stls.traffic_light_display(frame, is_zone_occupied = len(collected_vehicle) > 0) # Optional visualization
-            
-        # Get the current vehicle types for each zone, or 'none' if invalid
-        curr_vehic_zone = hanlde_current_vehic["vehicle"]
-
-        if curr_vehic_zone != prev_vehic_zone:
-            activate_relay(curr_vehic_zone)
-            prev_vehic_zone = curr_vehic_zone
-
-        data_to_display = {
-            "frame_name": frame_name,
-            "hanlde_current_vehic": hanlde_current_vehic,
-            "processing_time": (time.time() * 1000) - start_time
-        }
-        stls.display_zone_info(frame, data_to_display)  # Optional visualization       
-        success = stls.show_frame(frame, frame_name, wait_key, ord_key)  # Optional frame display
-
-    cv2.destroyAllWindows()
-    GPIO.cleanup()
+            with metrics.time_stage("queuing"):
+                vehicle, elapsed, changed = source["queuing"].update(first_vehicle, vehicle_count, curr_time)
+                zones_status = source["queuing"].status(class_list, elapsed)
+                request_zone_relays(source["relays"], zones_status, changed)
+            record_frame(source["recorder"], result, result["image"], detections, zones_status, vehicle, vehicle_count, changed, record_anomaly_latency)
+            metrics.observe("decision_latency_seconds", time.time() - result["capture_time"])
+            metrics.inc("frames_processed_total", labels={"source": source["name"]})
+
+            result["detections"] = detections
+            result["is_zone_occupied"] = bool(vehicle_count[0] > 0) if number_of_zones else False
+            result["hanlde_current_vehic"] = zones_status
+        packet["processing_time"] = (time.time() * 1000) - packet["start_time"]
+        return packet
+
+    def render_stage(packet):
+        for result in packet["results"]:
+            source = sources[result["index"]]
+            source_settings = packet["live"]["sources"][result["index"]]
+            frame = result["frame"]
+            window_name = source["window_name"]
+            if window_name.lower() == "off":
+                continue
+            with metrics.time_stage("draw"):
+                renderers[result["index"]].draw(frame, source_settings["zones"], source_settings["zone_centroids"], result["detections"],
+                                                result["hanlde_current_vehic"], packet["processing_time"], result["is_zone_occupied"])
+            with metrics.time_stage("display"):
+                if not stls.show_frame(frame, window_name, wait_key, ord_key):
+                    raise StopPipeline()
+
+    pipeline = Pipeline([
+        Stage("capture", capture_stage),
+        Stage("inference", inference_stage, queue_size=queue_size, policy=queue_policy),
+        Stage("decision", decision_stage, queue_size=queue_size, policy=queue_policy),
+        Stage("render", render_stage, queue_size=1, policy="drop"),
+    ])
+
+    try:
+        pipeline.run()
+    finally:
+        if watcher is not None:
+            watcher.stop()
+        for source in sources:
+            source["frame_source"].stop()
+            for relay in source["relays"].values():
+                relay.stop()
+            if source["recorder"] is not None:
+                source["recorder"].stop()
+        relay_driver.close()
+        if metrics_server is not None:
+            metrics_server.stop()
+        cv2.destroyAllWindows()
@@ -1,6 +1,7 @@
 from picamera2 import Picamera2
 import cv2
 import numpy as np
+from stls_lib.zone_cache import write_zone_cache
 
 points = []
 entry_counter = 0
@@ -47,6 +48,9 @@ def save_points_to_file(file_path, max_zones):
     print(f"Entry {entry_counter} saved to '{file_path}'.")
     points = []
     entry_counter += 1
+    if entry_counter == max_zones:  # All zones written: compile them for this frame size right away
+        write_zone_cache(file_path, frame_w, frame_h)
+        print(f"Compiled zones saved for {frame_w}x{frame_h}.")
     return True
 
 def instruction(frame):
@@ -0,0 +1,95 @@
+import time
+
+import cv2
+import numpy as np
+
+SCHEDULER_MODES = ["fixed", "motion"]
+
+
+class FixedStrideScheduler:
+    """Run inference on every `stride`-th frame."""
+
+    def __init__(self, stride=3):
+        self.stride = max(1, int(stride))
+        self.count = 0
+
+    def should_infer(self, frame, now=None):
+        self.count += 1
+        return self.count % self.stride == 0
+
+
+class MotionGatedScheduler:
+    """
+    Decide per frame whether YOLO has to run.
+
+    A downscaled grey frame is diffed against the previous one inside the
+    zone mask. While nothing in the zones changes, inference only runs every
+    `min_refresh_interval` seconds as a safety net. Once motion is seen,
+    every frame is inferred for `active_hold` seconds, or every `stride`-th
+    frame when the stride is raised to save time.
+    """
+
+    def __init__(self, zone_mask, downscale=4, pixel_threshold=25, motion_threshold=0.002, min_refresh_interval=1.0, active_hold=2.0):
+        self.zone_mask = zone_mask
+        self.downscale = max(1, int(downscale))
+        self.pixel_threshold = pixel_threshold
+        self.motion_threshold = motion_threshold
+        self.min_refresh_interval = min_refresh_interval
+        self.active_hold = active_hold
+        self.stride = 1
+        self.count = 0
+        self._small_mask = None
+        self._mask_pixels = 0
+        self._prev_small = None
+        self.last_motion_time = 0.0
+        self.last_inference_time = 0.0
+        self.motion_ratio = 0.0
+
+    def _prepare_mask(self, size):
+        if self.zone_mask is None:
+            self._small_mask = np.ones((size[1], size[0]), dtype=bool)
+        else:
+            self._small_mask = cv2.resize((self.zone_mask != 0).astype(np.uint8), size, interpolation=cv2.INTER_NEAREST).astype(bool)
+        self._mask_pixels = max(1, int(np.count_nonzero(self._small_mask)))
+
+    def measure_motion(self, frame):
+        """Fraction of zone pixels that changed since the previous frame."""
+        height, width = frame.shape[:2]
+        size = (max(1, width // self.downscale), max(1, height // self.downscale))
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+        if self._small_mask is None or self._small_mask.shape != small.shape:
+            self._prepare_mask(size)
+            self._prev_small = None
+
+        prev_small, self._prev_small = self._prev_small, small
+        if prev_small is None:
+            return 1.0
+
+        changed = cv2.absdiff(small, prev_small) > self.pixel_threshold
+        return np.count_nonzero(changed & self._small_mask) / self._mask_pixels
+
+    def should_infer(self, frame, now=None):
+        now = time.time() if now is None else now
+        self.motion_ratio = self.measure_motion(frame)
+        if self.motion_ratio >= self.motion_threshold:
+            self.last_motion_time = now
+
+        active = now - self.last_motion_time <= self.active_hold
+        if active:
+            self.count += 1
+        if (active and self.count % self.stride == 0) or now - self.last_inference_time >= self.min_refresh_interval:
+            self.last_inference_time = now
+            return True
+        return False
+
+
+def create_scheduler(mode, zone_mask=None, inference_stride=3, motion_threshold=0.002, min_refresh_interval=1.0):
+    mode = str(mode).lower()
+    if mode == "fixed":
+        return FixedStrideScheduler(inference_stride)
+    if mode == "motion":
+        return MotionGatedScheduler(zone_mask, motion_threshold=motion_threshold, min_refresh_interval=min_refresh_interval)
+    raise ValueError(f"Unknown inference_scheduler '{mode}'. Expected one of {SCHEDULER_MODES}.")
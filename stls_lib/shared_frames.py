@@ -0,0 +1,122 @@
+"""
+Single-writer frame ring in `multiprocessing.shared_memory`.
+
+A capture process writes frames into a fixed number of slots and a pipeline
+process copies the newest one out, so frames cross the process boundary
+without being pickled. Every slot carries the sequence number of the frame
+in it: the writer clears it before overwriting the pixels and sets it again
+afterwards, and a reader that finds a different number after its copy
+knows the frame was overwritten halfway and reads again.
+"""
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Header fields, one int64 each.
+_SEQ, _CLOSED, _WIDTH, _HEIGHT, _SLOTS = range(5)
+_HEADER_FIELDS = 8
+
+
+def _attach_shared_memory(name):
+    # Only the creator may unlink the ring. Before Python 3.13 attaching always registers the name with the
+    # resource tracker, which is harmless for workers spawned by the creator: they share its tracker, and the
+    # tracker keeps a single entry per name that the creator's unlink removes.
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def _ring_size(frame_width, frame_height, slots):
+    return 8 * _HEADER_FIELDS + 16 * slots + slots * frame_height * frame_width * 3
+
+
+class SharedFrameRing:
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.name = shm.name
+        header = np.ndarray((_HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        slots, frame_height, frame_width = int(header[_SLOTS]), int(header[_HEIGHT]), int(header[_WIDTH])
+        offset = 8 * _HEADER_FIELDS
+        self._header = header
+        self._slot_seq = np.ndarray((slots,), dtype=np.int64, buffer=shm.buf, offset=offset)
+        self._slot_time = np.ndarray((slots,), dtype=np.float64, buffer=shm.buf, offset=offset + 8 * slots)
+        self._frames = np.ndarray((slots, frame_height, frame_width, 3), dtype=np.uint8, buffer=shm.buf, offset=offset + 16 * slots)
+        self.shape = (frame_height, frame_width, 3)
+        self.slots = slots
+
+    @classmethod
+    def create(cls, name, frame_width, frame_height, slots=4):
+        """Allocate a ring; the process that creates it also unlinks it."""
+        shm = shared_memory.SharedMemory(name=name, create=True, size=_ring_size(frame_width, frame_height, slots))
+        header = np.ndarray((_HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[_WIDTH], header[_HEIGHT], header[_SLOTS] = frame_width, frame_height, slots
+        ring = cls(shm, owner=True)
+        ring._slot_seq[:] = -1
+        return ring
+
+    @classmethod
+    def attach(cls, name, timeout=10.0):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return cls(_attach_shared_memory(name), owner=False)
+            except FileNotFoundError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.1)
+
+    @property
+    def seq(self):
+        return int(self._header[_SEQ])
+
+    @property
+    def closed(self):
+        return bool(self._header[_CLOSED])
+
+    def reopen(self):
+        """Called by a (restarted) writer before its first frame."""
+        self._header[_CLOSED] = 0
+
+    def close_writer(self):
+        """Tell readers that no more frames will come, e.g. at the end of a video."""
+        self._header[_CLOSED] = 1
+
+    def write(self, frame, capture_time):
+        seq = int(self._header[_SEQ]) + 1
+        slot = seq % self.slots
+        self._slot_seq[slot] = -1
+        np.copyto(self._frames[slot], frame)
+        self._slot_time[slot] = capture_time
+        self._slot_seq[slot] = seq
+        self._header[_SEQ] = seq
+        return seq
+
+    def read(self, last_seq, out):
+        """
+        Copy the newest frame into `out` if it is newer than `last_seq`.
+        Returns (seq, capture_time), or None when there is no new frame.
+        """
+        while True:
+            seq = int(self._header[_SEQ])
+            if seq <= last_seq:
+                return None
+            slot = seq % self.slots
+            np.copyto(out, self._frames[slot])
+            capture_time = float(self._slot_time[slot])
+            if int(self._slot_seq[slot]) == seq:
+                return seq, capture_time
+            # The writer lapped the ring during the copy; take the newer frame instead.
+
+    def close(self):
+        # The numpy views must go before the mapping can be closed.
+        self._header = self._slot_seq = self._slot_time = self._frames = None
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
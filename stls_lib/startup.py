@@ -0,0 +1,46 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def run_startup_tasks(tasks, metrics=None):
+    """
+    Run independent startup tasks concurrently and report how long each took.
+
+    `tasks` maps a name to a callable. Model loading spends most of its time
+    importing torch and reading weights and the camera waits on the driver,
+    so running them side by side makes startup as long as the slowest task
+    rather than the sum of all of them. Returns {name: result}; the first
+    failing task's exception is re-raised after every task has finished.
+    """
+    durations = {}
+    start = time.perf_counter()
+
+    def timed(name, task):
+        task_start = time.perf_counter()
+        try:
+            return task()
+        finally:
+            durations[name] = time.perf_counter() - task_start
+
+    with ThreadPoolExecutor(max_workers=max(1, len(tasks)), thread_name_prefix="startup") as executor:
+        futures = {name: executor.submit(timed, name, task) for name, task in tasks.items()}
+    total = time.perf_counter() - start
+
+    print("startup: {")
+    for name in tasks:
+        print(f"    {name}={durations.get(name, 0.0) * 1000:.0f} ms")
+    print(f"    total={total * 1000:.0f} ms")
+    print("}")
+
+    if metrics is not None:
+        for name, duration in durations.items():
+            metrics.set_gauge("startup_seconds", duration, {"task": name})
+        metrics.set_gauge("startup_seconds", total, {"task": "total"})
+
+    results = {}
+    for name, future in futures.items():
+        error = future.exception()
+        if error is not None:
+            raise error
+        results[name] = future.result()
+    return results
@@ -2,7 +2,8 @@ import cv2
 import numpy as np
 import os
 import re
-from ultralytics import YOLO
+
+from stls_lib.detector import Detections
 
 def read_class_names(file_path: str) -> list:
         with open(file_path, 'r') as f:
@@ -86,15 +87,16 @@ def extract_data_from_file(file_path):
     }
     return data
 
-def draw_polylines_zones(image, data, frame_name, linesColor=(0, 255, 0), txtColor=(0, 0, 255), fontScale=0.65, thickness=2):
+def draw_polylines_zones(image, data, frame_name, linesColor=(0, 255, 0), txtColor=(0, 0, 255), fontScale=0.65, thickness=2, centroids=None):
     if frame_name.lower() == "off":
         return
 
-    for key, points in data.items():
-        points_array = np.array(points, dtype=np.int32)
+    # Compiled zones (stls_lib.zone_cache) are already int32 arrays with precomputed centroids.
+    for zone_indx, (key, points) in enumerate(data.items()):
+        points_array = np.asarray(points, dtype=np.int32)
         cv2.polylines(image, [points_array], isClosed=True, color=linesColor, thickness=2)
-        centroid = np.mean(points_array, axis=0).astype(int)
-        cv2.putText(image, f"{key}", tuple(centroid), cv2.FONT_HERSHEY_SIMPLEX, fontScale, txtColor, thickness)
+        centroid = centroids[zone_indx] if centroids is not None else np.mean(points_array, axis=0).astype(int)
+        cv2.putText(image, f"{key}", (int(centroid[0]), int(centroid[1])), cv2.FONT_HERSHEY_SIMPLEX, fontScale, txtColor, thickness)
         
 
 def display_zone_info(frame, data, color=(255, 255, 255), font = cv2.FONT_HERSHEY_SIMPLEX, font_scale = 0.75, thickness = 2, bg_color = (0, 0, 0), alpha = 0.6):
@@ -102,34 +104,37 @@ def display_zone_info(frame, data, color=(255, 255, 255), font = cv2.FONT_HERSHE
     if frame_name.lower() == "off":
         return
     
-    # number_of_zones = data["number_of_zones"]
+    # One entry per zone; a single dict is the zone-0 only format of handle_zone_queuing
     hanlde_current_vehic = data["hanlde_current_vehic"]
+    if isinstance(hanlde_current_vehic, dict):
+        hanlde_current_vehic = [hanlde_current_vehic]
     
     processing_time = data["processing_time"]
     frame_width = frame.shape[1]
-    overlay = frame.copy()
-    
-    curr_t = hanlde_current_vehic["current_time"]
-    curr_v = hanlde_current_vehic["vehicle"]
     
-    text1 = f"Zone: 0 | PV: {curr_v} [{curr_t}]"
-    position1 = (25, 25 + 30 * 0)
-    (text1_w, text1_h), _ = cv2.getTextSize(text1, font, font_scale, thickness)
+    # The text backgrounds are blended one rectangle at a time instead of through a copy of the whole frame.
+    zone_lines = []
+    for zone_indx, zone_status in enumerate(hanlde_current_vehic):
+        curr_t = zone_status["current_time"]
+        curr_v = zone_status["vehicle"]
+        text1 = f"Zone: {zone_indx} | PV: {curr_v} [{curr_t}]"
+        position1 = (25, 25 + 30 * zone_indx)
+        (text1_w, text1_h), _ = cv2.getTextSize(text1, font, font_scale, thickness)
+        blend_rect(frame, position1[0] - 5, position1[1] - text1_h - 5, position1[0] + text1_w + 5, position1[1] + 5, bg_color, alpha)
+        zone_lines.append((text1, position1))
     
     text = f"Process Time per frame: {processing_time:.2f} ms"
     if (frame_width > 1000):
         position = (frame_width - 550, 30)
     else:
-        position = (25, 25 + 30 * 2)
+        position = (25, 25 + 30 * (len(zone_lines) + 1))
     
     (text_w, text_h), _ = cv2.getTextSize(text, font, font_scale, thickness)
-    cv2.rectangle(overlay, (position[0] - 5, position[1] - text_h - 5), (position[0] + text_w + 5, position[1] + 5), bg_color, cv2.FILLED)
-    cv2.rectangle(overlay, (position1[0] - 5, position1[1] - text1_h - 5), (position1[0] + text1_w + 5, position1[1] + 5), bg_color, cv2.FILLED)
-    
-    cv2.addWeighted(overlay, alpha, frame, 1 - alpha, 0, frame)
+    blend_rect(frame, position[0] - 5, position[1] - text_h - 5, position[0] + text_w + 5, position[1] + 5, bg_color, alpha)
     
-    cv2.putText(frame, text1, position1, font, font_scale, color, thickness)
-    cv2.putText(frame, text1, position1, font, font_scale, color, 2, cv2.LINE_AA)
+    for text1, position1 in zone_lines:
+        cv2.putText(frame, text1, position1, font, font_scale, color, thickness)
+        cv2.putText(frame, text1, position1, font, font_scale, color, 2, cv2.LINE_AA)
     cv2.putText(frame, text, position, font, font_scale, color, thickness)
     cv2.putText(frame, text, position, font, font_scale, color, 2, cv2.LINE_AA)    
 
@@ -144,7 +149,18 @@ def check_camera(cap):
 def is_valid_vehicle(vehicle):
     return vehicle == "car" or vehicle == "motorbike"
 
-def track_objects_in_zones(frame, boxes, class_list, zones, collected_vehicle, frame_name):
+def get_vehicle_class_ids(class_list):
+    """Class ids of the valid vehicles, e.g. to filter detections during NMS."""
+    return [cls_id for cls_id, name in enumerate(class_list) if is_valid_vehicle(name)]
+
+def find_objects_in_zones(boxes, class_list, zones, collected_vehicle):
+    """
+    Collect the valid vehicles whose centre lies inside each zone. Returns the
+    filled `collected_vehicle` lists and the matched detections as
+    (x1, y1, x2, y2, cls, conf_score, cls_center_pnt) tuples for drawing later.
+    """
+    detections = []
+    valid_ids = set(get_vehicle_class_ids(class_list))
     for idx, box in enumerate(boxes):
         x1, y1, x2, y2, conf_score, cls = box
         x1, y1, x2, y2 = map(int, [x1, y1, x2, y2])
@@ -152,22 +168,134 @@ def track_objects_in_zones(frame, boxes, class_list, zones, collected_vehicle, f
         cls_center_x = int(x1 + x2) // 2
         cls_center_y = int(y1 + y2) // 2
         cls_center_pnt = (cls_center_x, cls_center_y)
+        if int(cls) not in valid_ids:
+            continue
         cls_name = class_list[int(cls)]
         for zone_indx, zone in enumerate(zones.values()):
-            if cv2.pointPolygonTest(np.array(zone, dtype=np.int32), cls_center_pnt, False) == 1 and is_valid_vehicle(cls_name):
+            if cv2.pointPolygonTest(np.array(zone, dtype=np.int32), cls_center_pnt, False) == 1:
                 collected_vehicle[zone_indx].append(cls_name)
-                show_object_info(frame, x1, y1, x2, y2, cls, conf_score, class_list, cls_center_pnt, frame_name)
-    
+                detections.append((x1, y1, x2, y2, cls, conf_score, cls_center_pnt))
+    return collected_vehicle, detections
+
+def rasterize_zones(zones, frame_width, frame_height):
+    """
+    Rasterize the zones into a frame-sized label mask. Bit `i` of a pixel is
+    set when it lies inside the i-th zone, so overlapping zones are kept.
+    """
+    number_of_zones = len(zones)
+    if number_of_zones <= 8:
+        dtype = np.uint8
+    elif number_of_zones <= 16:
+        dtype = np.uint16
+    elif number_of_zones <= 32:
+        dtype = np.uint32
+    else:
+        raise ValueError(f"At most 32 zones can be rasterized. Found: {number_of_zones}")
+
+    zone_mask = np.zeros((frame_height, frame_width), dtype=dtype)
+    layer = np.zeros((frame_height, frame_width), dtype=np.uint8)
+    for zone_indx, zone in enumerate(zones.values()):
+        layer.fill(0)
+        cv2.fillPoly(layer, [np.array(zone, dtype=np.int32)], 1)
+        zone_mask[layer.view(bool)] |= dtype(1 << zone_indx)
+    return zone_mask
+
+def lookup_zone_labels(boxes, class_list, zone_mask):
+    """
+    Look every box centre up in the mask built by rasterize_zones. Returns the
+    integer box coordinates, class ids, centres and zone bits per box; boxes
+    that are not valid vehicles get no zone bits. Detections from
+    stls_lib.detector already carry these columns.
+    """
+    if not isinstance(boxes, Detections):
+        boxes = Detections(boxes)
+    coords, cls_ids = boxes.coords, boxes.class_ids
+    centers_x, centers_y = boxes.centers[:, 0], boxes.centers[:, 1]
+
+    frame_height, frame_width = zone_mask.shape
+    inside = (centers_x >= 0) & (centers_x < frame_width) & (centers_y >= 0) & (centers_y < frame_height)
+    labels = np.zeros(len(boxes), dtype=np.int64)
+    labels[inside] = zone_mask[centers_y[inside], centers_x[inside]]
+
+    labels[~np.isin(cls_ids, get_vehicle_class_ids(class_list))] = 0
+    return coords, cls_ids, centers_x, centers_y, labels
+
+def get_detections(boxes, coords, cls_ids, centers_x, centers_y, labels):
+    detections = []
+    for idx in np.flatnonzero(labels):
+        x1, y1, x2, y2 = map(int, coords[idx])
+        detections.append((x1, y1, x2, y2, cls_ids[idx], "%.2f" % boxes[idx, 4], (int(centers_x[idx]), int(centers_y[idx]))))
+    return detections
+
+def find_zone_vehicles(boxes, class_list, zone_mask, number_of_zones, entry_times=None):
+    """
+    Per-zone summary for ZoneQueuing without building Python lists: the class
+    id of the first vehicle in each zone (-1 when empty), the number of
+    vehicles per zone and the detections to draw. The first vehicle is the
+    first box in the zone, or the one that entered it earliest when
+    `entry_times` holds an (N, number_of_zones) array of zone entry times.
+    """
+    first_vehicle = np.full(number_of_zones, -1, dtype=np.int64)
+    vehicle_count = np.zeros(number_of_zones, dtype=np.int64)
+    if boxes is None or len(boxes) == 0 or number_of_zones == 0:
+        return first_vehicle, vehicle_count, []
+
+    coords, cls_ids, centers_x, centers_y, labels = lookup_zone_labels(boxes, class_list, zone_mask)
+    in_zone = ((labels[:, None] >> np.arange(number_of_zones)) & 1).astype(bool)
+    vehicle_count = in_zone.sum(axis=0)
+    occupied = vehicle_count > 0
+    if entry_times is None:
+        first = in_zone.argmax(axis=0)
+    else:
+        first = np.where(in_zone, entry_times, np.inf).argmin(axis=0)
+    first_vehicle[occupied] = cls_ids[first[occupied]]
+    return first_vehicle, vehicle_count, get_detections(boxes, coords, cls_ids, centers_x, centers_y, labels)
+
+def count_zone_classes(boxes, class_list, zone_mask, number_of_zones):
+    """Number of vehicles of each class in each zone, as a (number_of_zones, len(class_list)) array."""
+    counts = np.zeros((number_of_zones, len(class_list)), dtype=np.int64)
+    if boxes is None or len(boxes) == 0 or number_of_zones == 0:
+        return counts
+
+    _, cls_ids, _, _, labels = lookup_zone_labels(boxes, class_list, zone_mask)
+    in_zone = ((labels[:, None] >> np.arange(number_of_zones)) & 1).astype(bool)
+    for zone_indx in range(number_of_zones):
+        counts[zone_indx] = np.bincount(cls_ids[in_zone[:, zone_indx]], minlength=len(class_list))
+    return counts
+
+def show_objects_info(frame, detections, class_list, frame_name, fill=None):
+    if frame_name.lower() == "off":
+        return
+    for x1, y1, x2, y2, cls, conf_score, cls_center_pnt in detections:
+        show_object_info(frame, x1, y1, x2, y2, cls, conf_score, class_list, cls_center_pnt, frame_name, fill)
+
+def track_objects_in_zones(frame, boxes, class_list, zones, collected_vehicle, frame_name):
+    collected_vehicle, detections = find_objects_in_zones(boxes, class_list, zones, collected_vehicle)
+    show_objects_info(frame, detections, class_list, frame_name)
+
     first_index = collected_vehicle[0] if len(collected_vehicle) > 0 else 'none'
     return first_index
 
-def show_object_info(frame, x1, y1, x2, y2, cls, conf_score, class_list, cls_center_pnt, frame_name):
+def blend_rect(frame, x1, y1, x2, y2, color, alpha, fill=None):
+    """
+    Blend a filled rectangle with corners (x1, y1) and (x2, y2), both
+    inclusive as in cv2.rectangle, into the frame in place. Only the pixels
+    under the rectangle are touched. `fill` can be a preallocated image of
+    `color` at least as large as the rectangle.
+    """
+    x1, y1 = max(0, int(x1)), max(0, int(y1))
+    x2, y2 = min(frame.shape[1], int(x2) + 1), min(frame.shape[0], int(y2) + 1)
+    if x2 <= x1 or y2 <= y1:
+        return
+    roi = frame[y1:y2, x1:x2]
+    fill = np.full_like(roi, color) if fill is None else fill[:y2 - y1, :x2 - x1]
+    cv2.addWeighted(fill, alpha, roi, 1 - alpha, 0, dst=roi)
+
+def show_object_info(frame, x1, y1, x2, y2, cls, conf_score, class_list, cls_center_pnt, frame_name, fill=None):
     if frame_name.lower() == "off":
         return
     colors = {'box': (86, 179, 255), 'text': (255, 255, 255), 'center': (255, 89, 94)}
-    overlay = frame.copy()
-    cv2.rectangle(overlay, (x1, y1), (x2, y2), colors['box'], cv2.FILLED)
-    cv2.addWeighted(overlay, 0.2, frame, 0.8, 0, frame)
+    blend_rect(frame, x1, y1, x2, y2, colors['box'], 0.2, fill)
     cv2.rectangle(frame, (x1, y1), (x2, y2), colors['box'], 2)
     cv2.circle(frame, cls_center_pnt, 4, colors['center'], -1)
     text = f"{class_list[int(cls)]} {conf_score}"
@@ -180,9 +308,16 @@ def init_list_of_collected_vehicle(number_of_zones):
     return collected_vehicle
 
 
-def load_model(weights_file_path):
+def load_model(weights_file_path, backend="pytorch", input_size=640, quantize="none", warmup=False):
     check_exist_file(weights_file_path)
-    return YOLO(weights_file_path, "v11")
+    if backend == "pytorch" and not warmup:
+        # Imported here so that modes which never load a model do not pay for torch/ultralytics.
+        from ultralytics import YOLO
+        return YOLO(weights_file_path, "v11")
+
+    # Exported backends are built once and cached next to the weights.
+    from stls_lib.model_backend import load_model_backend
+    return load_model_backend(weights_file_path, backend, input_size, quantize, warmup)
 
 
 def load_class_names(class_names_file_path):
@@ -195,12 +330,67 @@ def load_camera(video_source):
     check_camera(captured)
     return captured
 
-def get_prediction_boxes(frame, yolo_model, confidence):
-    pred = yolo_model.predict(source=[frame], save=False, conf=confidence)
+def get_prediction_boxes(frame, yolo_model, confidence, imgsz=None):
+    options = {} if imgsz is None else {"imgsz": imgsz}
+    pred = yolo_model.predict(source=[frame], save=False, conf=confidence, verbose=False, **options)
     results = pred[0]
     boxes = results.boxes.data.numpy()
     return boxes
 
+def get_prediction_boxes_batch(frames, yolo_model, confidence, imgsz=None):
+    """Run one batched predict call over several frames and return one box array per frame."""
+    if len(frames) == 0:
+        return []
+    options = {} if imgsz is None else {"imgsz": imgsz}
+    pred = yolo_model.predict(source=list(frames), save=False, conf=confidence, verbose=False, **options)
+    return [results.boxes.data.numpy() for results in pred]
+
+
+def get_zones_roi(zones, frame_width, frame_height, margin=0):
+    """Union bounding rectangle (x1, y1, x2, y2) of all zones grown by `margin` pixels."""
+    if not zones:
+        return (0, 0, frame_width, frame_height)
+    points = np.concatenate([np.array(zone, dtype=np.int32).reshape(-1, 2) for zone in zones.values()])
+    x1, y1 = points.min(axis=0) - margin
+    x2, y2 = points.max(axis=0) + margin + 1
+    return (max(0, int(x1)), max(0, int(y1)), min(frame_width, int(x2)), min(frame_height, int(y2)))
+
+def letterbox_roi(frame, roi, input_size, pad_color=(114, 114, 114)):
+    """
+    Crop `roi` out of the frame and letterbox it into an input_size x input_size
+    image. Returns the image and the (scale, pad_x, pad_y, roi_x, roi_y)
+    transform needed by map_boxes_to_frame. An ROI with nothing of the frame
+    inside it falls back to the whole frame.
+    """
+    frame_h, frame_w = frame.shape[:2]
+    x1, y1, x2, y2 = max(0, roi[0]), max(0, roi[1]), min(frame_w, roi[2]), min(frame_h, roi[3])
+    if x2 <= x1 or y2 <= y1:
+        x1, y1, x2, y2 = 0, 0, frame_w, frame_h
+    crop = frame[y1:y2, x1:x2]
+    crop_h, crop_w = crop.shape[:2]
+    scale = min(input_size / crop_w, input_size / crop_h)
+    new_w, new_h = max(1, round(crop_w * scale)), max(1, round(crop_h * scale))
+    pad_x, pad_y = (input_size - new_w) // 2, (input_size - new_h) // 2
+
+    image = np.empty((input_size, input_size, 3), dtype=frame.dtype)
+    image[:] = pad_color
+    image[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = cv2.resize(crop, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    return image, (scale, pad_x, pad_y, x1, y1)
+
+def map_boxes_to_frame(boxes, transform):
+    """Map boxes predicted on a letterbox_roi image back to full-frame coordinates."""
+    if len(boxes) == 0:
+        return boxes
+    scale, pad_x, pad_y, roi_x, roi_y = transform
+    boxes = np.array(boxes, dtype=np.float32, copy=True)
+    boxes[:, [0, 2]] = (boxes[:, [0, 2]] - pad_x) / scale + roi_x
+    boxes[:, [1, 3]] = (boxes[:, [1, 3]] - pad_y) / scale + roi_y
+    return boxes
+
+def scale_roi(roi, scale_x, scale_y):
+    x1, y1, x2, y2 = roi
+    return (int(x1 * scale_x), int(y1 * scale_y), int(np.ceil(x2 * scale_x)), int(np.ceil(y2 * scale_y)))
+
 
 def show_frame(frame, frame_name, wait_key, ord_key):
     if frame_name.lower() == "off":
@@ -212,6 +402,17 @@ def show_frame(frame, frame_name, wait_key, ord_key):
     return True
 
 
+def parse_value(key, value):
+    if key == "mqtt_broker" or key == "SERVICE_UUID" or key == "CHARACTERISTIC_UUID" or key == "IP_ESP32_1" or key == "IP_ESP32_2":
+        return value
+    # Try to convert to float or int if possible
+    if value.replace('.', '', 1).isdigit() and value.count('.') < 2:
+        if '.' in value:
+            return float(value)  # Convert to float
+        return int(value)  # Convert to int
+    return value
+
+
 def extract_root_data(file_path: str):
     check_exist_file(file_path)
     get_data = {}
@@ -227,21 +428,39 @@ def extract_root_data(file_path: str):
             key, value = line.split(":", 1)
             key = key.strip()
             value = value.strip()
-            
-            if key == "mqtt_broker" or key == "SERVICE_UUID" or key == "CHARACTERISTIC_UUID" or key == "IP_ESP32_1" or key == "IP_ESP32_2":
-                get_data[key] = value
-            else:
-                # Try to convert to float or int if possible
-                if value.replace('.', '', 1).isdigit() and value.count('.') < 2:
-                    if '.' in value:
-                        get_data[key] = float(value)  # Convert to float
-                    else:
-                        get_data[key] = int(value)  # Convert to int
-                else:
-                    get_data[key] = value
+            get_data[key] = parse_value(key, value)
 
     print_data(get_data)
     return get_data
+
+
+def extract_sources_from_file(file_path: str):
+    """
+    Read the multi-source configuration. Every `source: <name>` line starts a
+    new source; the `key: value` lines after it belong to that source.
+    """
+    check_exist_file(file_path)
+    sources = []
+
+    with open(file_path, 'r') as file:
+        for line in file:
+            line = line.strip()
+            if ':' not in line or line.startswith('#'):
+                continue
+
+            key, value = line.split(":", 1)
+            key = key.strip()
+            value = value.strip()
+            if key == "source":
+                sources.append({"name": value})
+            elif not sources:
+                raise ValueError(f"'{key}' found before the first 'source:' line in '{file_path}'.")
+            else:
+                sources[-1][key] = parse_value(key, value)
+
+    for source in sources:
+        print_data(source)
+    return sources
     
 
 def handle_zone_queuing(collected_vehicle, current_time, zones_data, interval):
@@ -0,0 +1,248 @@
+"""
+Run several intersection pipelines on one machine, one process each.
+
+Every block of the sources file becomes two worker processes: a capture
+worker that writes the camera frames into a SharedFrameRing and a pipeline
+worker that runs rp_process_video.main on the frames of that ring. Each
+pipeline has its own interpreter, so pipelines never wait on each other's
+GIL, and each pair is pinned to its own share of the CPU cores. Workers pin
+themselves before they import OpenCV, NumPy or torch, so the thread pools
+those libraries start inherit the cores; this module therefore only imports
+them inside the functions that need them.
+
+The supervisor owns the rings and restarts a worker that crashes after a
+delay that grows while it keeps crashing; the other pipelines keep running.
+A pipeline that stops on its own (end of a video, the quit key) is not
+restarted.
+"""
+import multiprocessing
+import multiprocessing.connection
+import os
+import re
+import signal
+import time
+
+
+def _stop_worker(signum, frame):
+    raise KeyboardInterrupt()
+
+
+def _pin_to_cores(cores):
+    # Pins the calling thread; every thread it starts afterwards inherits the cores.
+    if hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, cores)
+        except OSError as e:
+            print(f"Supervisor: cannot pin pid {os.getpid()} to cores {cores}: {e}")
+
+
+def _limit_threads(threads):
+    import cv2
+
+    cv2.setNumThreads(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def capture_worker(ring_name, cores, frame_source, video_source, frame_width, frame_height):
+    """Grab frames from the camera or video and write them into the ring at the frame size."""
+    _pin_to_cores(cores)
+    import cv2
+    from stls_lib.frame_source import create_frame_source
+    from stls_lib.shared_frames import SharedFrameRing
+
+    signal.signal(signal.SIGTERM, _stop_worker)
+    ring = SharedFrameRing.attach(ring_name)
+    ring.reopen()
+    source = create_frame_source(frame_source, frame_width, frame_height, video_source=video_source)
+    try:
+        source.start()
+        while True:
+            captured = source.read()
+            if captured is None:
+                if source.finished:
+                    break
+                continue
+            _, capture_time, frame = captured
+            if frame.shape[1] != frame_width or frame.shape[0] != frame_height:
+                frame = cv2.resize(frame, (frame_width, frame_height))
+            ring.write(frame, capture_time)
+        ring.close_writer()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        source.stop()
+        ring.close()
+
+
+def pipeline_worker(ring_name, cores, options):
+    """Run the single-source pipeline on the frames of the ring."""
+    _pin_to_cores(cores)
+    from stls_lib.rp import rp_process_video
+
+    signal.signal(signal.SIGTERM, _stop_worker)
+    _limit_threads(len(cores))
+    try:
+        rp_process_video.main(frame_source="shared", video_source=ring_name, **options)
+    except KeyboardInterrupt:
+        pass
+
+
+def get_core_groups(cpus, count):
+    """Split the usable cores ("auto" or a list such as "0,1,2,3") into `count` groups, one per pipeline."""
+    from stls_lib.latency_controller import parse_int_list
+
+    if str(cpus).lower() == "auto":
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    else:
+        cores = parse_int_list(cpus)
+    if count > len(cores):
+        # More pipelines than cores: they share cores round-robin.
+        return [[cores[i % len(cores)]] for i in range(count)]
+    size, extra = divmod(len(cores), count)
+    bounds = [i * size + min(i, extra) for i in range(count + 1)]
+    return [cores[bounds[i]:bounds[i + 1]] for i in range(count)]
+
+
+def get_pipeline_options(config, index, pipeline_options):
+    """
+    Options of one pipeline worker: the shared options with the source's
+    zones and relays, and a window, metrics port and record folder of its own.
+    """
+    from stls_lib.rp.rp_process_video import get_source_zone_relays
+
+    name = config["name"]
+    zone_relays = get_source_zone_relays(config)
+    if not zone_relays:
+        raise ValueError(f"Source '{name}' has no relays. Under the supervisor every pipeline needs relay pins of its own.")
+
+    options = dict(pipeline_options)
+    options.update(zones_file_path=config["zones_file_path"], zone_relays=zone_relays, capture_mode="main")
+    if options["frame_name"].lower() != "off":
+        options["frame_name"] = f"{options['frame_name']} - {name}"
+    if options.get("metrics_port"):
+        options["metrics_port"] = options["metrics_port"] + index
+    if str(options.get("metrics_json_path", "none")).lower() != "none":
+        stem, ext = os.path.splitext(options["metrics_json_path"])
+        options["metrics_json_path"] = f"{stem}_{name}{ext}"
+    options["record_dir"] = os.path.join(options.get("record_dir", "recordings"), name)
+    return options
+
+
+class Supervisor:
+    def __init__(self, workers, restart_delay=1.0, max_restart_delay=30.0, stable_seconds=60.0):
+        """
+        `workers` is a list of dicts with name, target, args, cores and
+        group; the targets pin themselves to the cores passed in their
+        args. A worker that exits cleanly is done; when it is marked
+        `ends_group`, the rest of its group is stopped as well.
+        """
+        self.workers = workers
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.stable_seconds = stable_seconds
+        self._context = multiprocessing.get_context("spawn")
+        for worker in workers:
+            worker.update(process=None, state="new", restarts=0, delay=restart_delay, restart_at=0.0, started=0.0)
+
+    def _start(self, worker):
+        process = self._context.Process(target=worker["target"], args=worker["args"], name=worker["name"])
+        process.start()
+        worker.update(process=process, state="running", started=time.monotonic())
+        print(f"Supervisor: started {worker['name']} (pid {process.pid}, cores {worker['cores']}).")
+
+    def _finish_group(self, group):
+        for worker in self.workers:
+            if worker["group"] == group:
+                if worker["state"] == "running":
+                    worker["process"].terminate()
+                worker["state"] = "done"
+
+    def _on_exit(self, worker):
+        process = worker["process"]
+        process.join()
+        if process.exitcode == 0:
+            print(f"Supervisor: {worker['name']} finished.")
+            if worker.get("ends_group"):
+                self._finish_group(worker["group"])
+            worker["state"] = "done"
+            return
+
+        # A worker that ran for a while before crashing starts over from the shortest delay.
+        if time.monotonic() - worker["started"] >= self.stable_seconds:
+            worker["delay"] = self.restart_delay
+        print(f"Supervisor: {worker['name']} exited with code {process.exitcode}, restarting in {worker['delay']:.1f} s.")
+        worker.update(state="waiting", restart_at=time.monotonic() + worker["delay"])
+        worker["delay"] = min(worker["delay"] * 2, self.max_restart_delay)
+
+    def run(self):
+        for worker in self.workers:
+            self._start(worker)
+        while any(worker["state"] != "done" for worker in self.workers):
+            running = {worker["process"].sentinel: worker for worker in self.workers if worker["state"] == "running"}
+            for sentinel in multiprocessing.connection.wait(list(running), timeout=0.5):
+                if running[sentinel]["state"] == "running":
+                    self._on_exit(running[sentinel])
+
+            now = time.monotonic()
+            for worker in self.workers:
+                if worker["state"] == "waiting" and worker["restart_at"] <= now:
+                    worker["restarts"] += 1
+                    self._start(worker)
+
+    def stop(self):
+        processes = [worker["process"] for worker in self.workers if worker["process"] is not None]
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join(timeout=5.0)
+            if process.is_alive():
+                process.kill()
+                process.join()
+
+
+def run_supervisor(sources_file_path, pipeline_options, cpus="auto", ring_slots=4, restart_delay=1.0, max_restart_delay=30.0):
+    """
+    Start a capture and a pipeline worker for every source in
+    `sources_file_path` and keep them running until every pipeline finished
+    or the supervisor is stopped. `pipeline_options` are the keyword
+    arguments of rp_process_video.main shared by all pipelines.
+    """
+    from stls_lib import stls
+    from stls_lib.shared_frames import SharedFrameRing
+
+    configs = stls.extract_sources_from_file(sources_file_path)
+    if not configs:
+        raise ValueError(f"No sources found in '{sources_file_path}'.")
+    frame_width, frame_height = pipeline_options["frame_width"], pipeline_options["frame_height"]
+    core_groups = get_core_groups(cpus, len(configs))
+
+    rings = []
+    workers = []
+    try:
+        for index, (config, cores) in enumerate(zip(configs, core_groups)):
+            name = config["name"]
+            options = get_pipeline_options(config, index, pipeline_options)
+            ring = SharedFrameRing.create(f"stls_{os.getpid()}_{re.sub(r'[^A-Za-z0-9]', '_', name)}", frame_width, frame_height, ring_slots)
+            rings.append(ring)
+            workers.append({"name": f"capture {name}", "group": name, "cores": cores, "target": capture_worker,
+                            "args": (ring.name, cores, config.get("frame_source", "picamera"), config.get("video_source"), frame_width, frame_height)})
+            workers.append({"name": f"pipeline {name}", "group": name, "cores": cores, "target": pipeline_worker,
+                            "args": (ring.name, cores, options), "ends_group": True})
+
+        supervisor = Supervisor(workers, restart_delay, max_restart_delay)
+        previous_handler = signal.signal(signal.SIGTERM, _stop_worker)
+        try:
+            supervisor.run()
+        except KeyboardInterrupt:
+            print("Supervisor: stopping.")
+        finally:
+            supervisor.stop()
+            signal.signal(signal.SIGTERM, previous_handler)
+    finally:
+        for ring in rings:
+            ring.close()
@@ -0,0 +1,169 @@
+import numpy as np
+
+# Column layout of the arrays returned by IoUTracker. The first six columns
+# match the YOLO box layout, so the result can go straight into the zone lookup.
+# With a zone mask one more column per zone follows: the time the track's
+# centre first entered that zone, inf while it has not.
+TRACK_COLUMNS = ["x1", "y1", "x2", "y2", "conf", "cls", "track_id", "arrival_time"]
+ZONE_ENTRY_COLUMN = len(TRACK_COLUMNS)
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """Pairwise IoU between two (N, 4) and (M, 4) arrays of x1, y1, x2, y2 boxes."""
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return np.zeros((len(boxes_a), len(boxes_b)), dtype=np.float32)
+    a = boxes_a[:, None, :4]
+    b = boxes_b[None, :, :4]
+    inter_w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    inter_h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = inter_w * inter_h
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / np.maximum(area_a + area_b - inter, 1e-6)
+
+
+class Track:
+    __slots__ = ("track_id", "box", "velocity", "conf", "cls", "arrival_time", "zone_entry", "last_seen", "hits")
+
+    def __init__(self, track_id, box, conf, cls, now):
+        self.track_id = track_id
+        self.box = np.asarray(box, dtype=np.float32)
+        self.velocity = np.zeros(2, dtype=np.float32)  # centre motion in pixels per second
+        self.conf = conf
+        self.cls = cls
+        self.arrival_time = now
+        self.zone_entry = {}  # zone index -> time the centre was first inside it
+        self.last_seen = now
+        self.hits = 1
+
+    def center(self):
+        return np.array([(self.box[0] + self.box[2]) / 2, (self.box[1] + self.box[3]) / 2], dtype=np.float32)
+
+    def predicted_box(self, now):
+        dx, dy = self.velocity * (now - self.last_seen)
+        return self.box + np.array([dx, dy, dx, dy], dtype=np.float32)
+
+
+class IoUTracker:
+    """
+    Greedy IoU tracker with a centroid-distance fallback.
+
+    Detections are matched to tracks by IoU against the constant-velocity
+    prediction of each track; leftovers are matched by centre distance. Each
+    track keeps a persistent id, the time it first appeared and, when a
+    zone mask is passed, the time its centre first entered each zone, so
+    callers can queue each zone's vehicles in the order they entered it.
+    Between inference frames `predict` moves the tracks along their last
+    known velocity.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_distance=60.0, max_age=1.0, velocity_smoothing=0.5):
+        self.iou_threshold = iou_threshold
+        self.max_distance = max_distance
+        self.max_age = max_age
+        self.velocity_smoothing = velocity_smoothing
+        self.tracks = []
+        self._next_id = 1
+        self._zone_mask = None
+
+    def reset(self):
+        self.tracks = []
+
+    def update(self, boxes, now, zone_mask=None, number_of_zones=0):
+        """Feed the detections of an inference frame. Returns the current tracks."""
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 6) if len(boxes) else np.zeros((0, 6), dtype=np.float32)
+        predicted = np.array([track.predicted_box(now) for track in self.tracks], dtype=np.float32).reshape(-1, 4)
+
+        matches = []
+        unmatched_tracks = set(range(len(self.tracks)))
+        unmatched_dets = set(range(len(boxes)))
+
+        ious = iou_matrix(predicted, boxes)
+        if ious.size:
+            for flat in np.argsort(-ious, axis=None):
+                t, d = np.unravel_index(flat, ious.shape)
+                if ious[t, d] < self.iou_threshold:
+                    break
+                if t in unmatched_tracks and d in unmatched_dets:
+                    matches.append((t, d))
+                    unmatched_tracks.discard(t)
+                    unmatched_dets.discard(d)
+
+        if unmatched_tracks and unmatched_dets:
+            tracks_idx = sorted(unmatched_tracks)
+            dets_idx = sorted(unmatched_dets)
+            track_centers = (predicted[tracks_idx, :2] + predicted[tracks_idx, 2:4]) / 2
+            det_centers = (boxes[dets_idx, :2] + boxes[dets_idx, 2:4]) / 2
+            distances = np.linalg.norm(track_centers[:, None, :] - det_centers[None, :, :], axis=2)
+            for flat in np.argsort(distances, axis=None):
+                i, j = np.unravel_index(flat, distances.shape)
+                if distances[i, j] > self.max_distance:
+                    break
+                t, d = tracks_idx[i], dets_idx[j]
+                if t in unmatched_tracks and d in unmatched_dets:
+                    matches.append((t, d))
+                    unmatched_tracks.discard(t)
+                    unmatched_dets.discard(d)
+
+        for t, d in matches:
+            track = self.tracks[t]
+            dt = now - track.last_seen
+            old_center = track.center()
+            track.box = boxes[d, :4].copy()
+            if dt > 0:
+                velocity = (track.center() - old_center) / dt
+                track.velocity = self.velocity_smoothing * velocity + (1 - self.velocity_smoothing) * track.velocity
+            track.conf = float(boxes[d, 4])
+            track.cls = int(boxes[d, 5])
+            track.last_seen = now
+            track.hits += 1
+
+        for d in sorted(unmatched_dets):
+            self.tracks.append(Track(self._next_id, boxes[d, :4], float(boxes[d, 4]), int(boxes[d, 5]), now))
+            self._next_id += 1
+
+        self.tracks = [track for track in self.tracks if now - track.last_seen <= self.max_age]
+        return self.predict(now, zone_mask, number_of_zones)
+
+    def _record_zone_entries(self, tracks, boxes, now, zone_mask, number_of_zones):
+        # Zone indices only mean the same zones within one mask; a reloaded zones file starts the entries over.
+        if zone_mask is not self._zone_mask:
+            for track in self.tracks:
+                track.zone_entry = {}
+            self._zone_mask = zone_mask
+        coords = boxes.astype(np.int64)
+        centers_x = (coords[:, 0] + coords[:, 2]) // 2
+        centers_y = (coords[:, 1] + coords[:, 3]) // 2
+        frame_height, frame_width = zone_mask.shape
+        inside = (centers_x >= 0) & (centers_x < frame_width) & (centers_y >= 0) & (centers_y < frame_height)
+        labels = np.zeros(len(tracks), dtype=np.int64)
+        labels[inside] = zone_mask[centers_y[inside], centers_x[inside]]
+
+        entry_times = np.full((len(tracks), number_of_zones), np.inf)
+        for row, (track, label) in enumerate(zip(tracks, labels)):
+            for zone_indx in range(number_of_zones):
+                if label >> zone_indx & 1 and zone_indx not in track.zone_entry:
+                    track.zone_entry[zone_indx] = now
+            for zone_indx, entered in track.zone_entry.items():
+                if zone_indx < number_of_zones:
+                    entry_times[row, zone_indx] = entered
+        return entry_times
+
+    def predict(self, now, zone_mask=None, number_of_zones=0):
+        """
+        Return the tracks as an (N, 8) array laid out as TRACK_COLUMNS, moved
+        to `now` by their velocity and sorted by arrival time (oldest first).
+        With a zone mask, `number_of_zones` zone entry time columns follow.
+        """
+        tracks = sorted(
+            (track for track in self.tracks if now - track.last_seen <= self.max_age),
+            key=lambda track: (track.arrival_time, track.track_id),
+        )
+        number_of_zones = number_of_zones if zone_mask is not None else 0
+        result = np.zeros((len(tracks), ZONE_ENTRY_COLUMN + number_of_zones), dtype=np.float64)
+        for row, track in enumerate(tracks):
+            result[row, :4] = track.predicted_box(now)
+            result[row, 4:ZONE_ENTRY_COLUMN] = (track.conf, track.cls, track.track_id, track.arrival_time)
+        if zone_mask is not None:
+            result[:, ZONE_ENTRY_COLUMN:] = self._record_zone_entries(tracks, result[:, :4], now, zone_mask, number_of_zones)
+        return result
@@ -0,0 +1,110 @@
+"""
+Compiled zones.
+
+Parsing zones.txt, rescaling every point and rasterizing the label mask is
+done once and stored in a `.npz` next to the zones file, one per frame size.
+The artifact records the sha256 of the zones file it was built from, so it
+is rebuilt automatically when zones.txt or the frame size changes.
+"""
+import os
+
+import numpy as np
+
+from stls_lib import stls
+from stls_lib.model_backend import hash_file
+
+ZONE_CACHE_VERSION = 1
+
+
+def get_zone_cache_path(zones_file_path, frame_width, frame_height):
+    stem = os.path.splitext(os.path.abspath(zones_file_path))[0]
+    return f"{stem}.{frame_width}x{frame_height}.npz"
+
+
+def compile_zones(zones_file_path, frame_width, frame_height):
+    """
+    Parse and scale the zones of `zones_file_path` to the frame size. Returns
+    a dict with the zones as {zone_id: int32 (N, 2) polygon}, their centroids
+    and bounding rects (x1, y1, x2, y2), the rasterized label mask and the
+    number of zones.
+    """
+    data = stls.extract_data_from_file(zones_file_path)
+    zones = stls.convert_coordinates(data["zones"], data["frame_width"], data["frame_height"], frame_width, frame_height)
+    zones = {zone_id: np.array(zone, dtype=np.int32).reshape(-1, 2) for zone_id, zone in zones.items()}
+    return {
+        "zones": zones,
+        "centroids": np.array([np.mean(zone, axis=0) for zone in zones.values()], dtype=np.int32).reshape(-1, 2),
+        "rects": np.array([(*zone.min(axis=0), *(zone.max(axis=0) + 1)) for zone in zones.values()], dtype=np.int32).reshape(-1, 4),
+        "zone_mask": stls.rasterize_zones(zones, frame_width, frame_height),
+        "number_of_zones": data["number_of_zones"],
+    }
+
+
+def save_zone_cache(compiled, cache_path, source_hash, frame_width, frame_height):
+    zones = compiled["zones"]
+    points = np.concatenate(list(zones.values())) if zones else np.zeros((0, 2), dtype=np.int32)
+    tmp_path = f"{cache_path}.tmp.npz"
+    np.savez(
+        tmp_path,
+        version=ZONE_CACHE_VERSION,
+        source_hash=source_hash,
+        frame_size=np.array([frame_width, frame_height]),
+        number_of_zones=compiled["number_of_zones"],
+        zone_ids=np.array(list(zones.keys()), dtype=np.int64),
+        # Polygons have different lengths, so they are stored back to back with their point counts.
+        lengths=np.array([len(zone) for zone in zones.values()], dtype=np.int64),
+        points=points,
+        centroids=compiled["centroids"],
+        rects=compiled["rects"],
+        zone_mask=compiled["zone_mask"],
+    )
+    os.replace(tmp_path, cache_path)
+
+
+def read_zone_cache(cache_path, source_hash, frame_width, frame_height):
+    """The compiled zones stored in `cache_path`, or None when it is missing or stale."""
+    try:
+        with np.load(cache_path) as cache:
+            if (int(cache["version"]) != ZONE_CACHE_VERSION
+                    or str(cache["source_hash"]) != source_hash
+                    or tuple(cache["frame_size"]) != (frame_width, frame_height)):
+                return None
+            polygons = np.split(cache["points"], np.cumsum(cache["lengths"])[:-1]) if len(cache["lengths"]) else []
+            return {
+                "zones": dict(zip(cache["zone_ids"].tolist(), polygons)),
+                "centroids": cache["centroids"],
+                "rects": cache["rects"],
+                "zone_mask": cache["zone_mask"],
+                "number_of_zones": int(cache["number_of_zones"]),
+            }
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def write_zone_cache(zones_file_path, frame_width, frame_height):
+    """Compile the zones file for one frame size and store the artifact next to it."""
+    compiled = compile_zones(zones_file_path, frame_width, frame_height)
+    cache_path = get_zone_cache_path(zones_file_path, frame_width, frame_height)
+    save_zone_cache(compiled, cache_path, hash_file(zones_file_path), frame_width, frame_height)
+    return compiled
+
+
+def load_zones(zones_file_path, frame_width, frame_height):
+    """
+    Compiled zones for the frame size, read from the cache when it matches
+    the current zones file and rebuilt otherwise.
+    """
+    stls.check_exist_file(zones_file_path)
+    source_hash = hash_file(zones_file_path)
+    cache_path = get_zone_cache_path(zones_file_path, frame_width, frame_height)
+    compiled = read_zone_cache(cache_path, source_hash, frame_width, frame_height)
+    if compiled is not None:
+        return compiled
+
+    print(f"Compiling zones '{zones_file_path}' for {frame_width}x{frame_height}.")
+    compiled = compile_zones(zones_file_path, frame_width, frame_height)
+    try:
+        save_zone_cache(compiled, cache_path, source_hash, frame_width, frame_height)
+    except OSError as e:
+        print(f"Cannot write zone cache '{cache_path}': {e}")
+    return compiled
@@ -0,0 +1,47 @@
+import numpy as np
+
+from stls_lib import stls
+from stls_lib.queuing import NO_VEHICLE, ZoneQueuing
+
+CLASS_LIST = ["car", "motorbike", "bus", "truck"]
+
+
+def run_baseline(zone_vehicles, times, interval):
+    """handle_zone_queuing once per zone and frame, as the single-zone loop did."""
+    zones_data = [{"countdown_start_time": 0.0, "refresh": False, "get_vehicle": 'none'} for _ in zone_vehicles[0]]
+    return [
+        [stls.handle_zone_queuing(collected_vehicle, current_time, zone_data, interval)
+         for collected_vehicle, zone_data in zip(frame, zones_data)]
+        for frame, current_time in zip(zone_vehicles, times)
+    ]
+
+
+def run_vectorized(zone_vehicles, times, interval):
+    queuing = ZoneQueuing(len(zone_vehicles[0]), interval)
+    statuses = []
+    for frame, current_time in zip(zone_vehicles, times):
+        first_vehicle = [CLASS_LIST.index(vehicles[0]) if vehicles else NO_VEHICLE for vehicles in frame]
+        vehicle_count = [len(vehicles) for vehicles in frame]
+        _, elapsed, _ = queuing.update(first_vehicle, vehicle_count, current_time)
+        statuses.append(queuing.status(CLASS_LIST, elapsed))
+    return statuses
+
+
+def test_zone_queuing_matches_handle_zone_queuing():
+    rng = np.random.default_rng(0)
+    number_of_zones, frames, interval = 4, 400, 1.0
+    times = 1000.0 + np.cumsum(rng.uniform(0.05, 0.3, frames))
+    zone_vehicles = [
+        [list(rng.choice(CLASS_LIST, size=rng.integers(0, 4))) for _ in range(number_of_zones)]
+        for _ in range(frames)
+    ]
+    assert run_vectorized(zone_vehicles, times, interval) == run_baseline(zone_vehicles, times, interval)
+
+
+def test_single_vehicle_is_released_when_countdown_ends():
+    # The baseline only keeps a vehicle after the countdown when more than one is waiting.
+    times = [0.5, 1.0, 1.6, 2.0]
+    zone_vehicles = [[["car"]], [["car"]], [["car"]], [["car", "bus"]]]
+    statuses = run_vectorized(zone_vehicles, times, 1.0)
+    assert statuses == run_baseline(zone_vehicles, times, 1.0)
+    assert [status[0]["vehicle"] for status in statuses] == ["car", "car", "none", "car"]